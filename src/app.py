@@ -78,7 +78,7 @@ def init_session_state():
         'view_mode': 'inspection',  # 'inspection' or 'history'
         'tracker_iou': 0.3,
         'tracker_min_hits': 2,
-        'min_distance': 5.0,
+        'min_distance': 10.0,
         'view_session': None,
         'export_session': None,
         'realtime_gps_main': None,  # For realtime GPS data
@@ -118,7 +118,7 @@ start_btn, stop_btn, reset_btn, video_path, conf_thresh, gps_config, view_histor
 # ==========================================
 # 6. REALTIME GPS WIDGET (if mode is realtime)
 # ==========================================
-if gps_config.get('mode') == 'realtime':
+if gps_config.mode == 'realtime':
     with st.sidebar:
         st.markdown("### 📍 GPS Status")
         # Render GPS widget di sidebar
@@ -320,7 +320,7 @@ with col_left:
 
 with col_right:
     # Show GPS widget in main area if realtime mode
-    if gps_config.get('mode') == 'realtime':
+    if gps_config.mode == 'realtime':
         gps_status_placeholder = st.empty()
         with gps_status_placeholder.container():
             st.markdown("#### 📍 Live GPS Tracking")
@@ -372,7 +372,7 @@ if use_browser_camera:
                 min_hits=1,
                 min_distance_meters=st.session_state.get('min_distance', 10.0)
             )
-            st.session_state['browser_gps'] = GPSManager(mode=gps_config.get('mode', 'simulation'))
+            st.session_state['browser_gps'] = GPSManager(mode=gps_config.mode)
             st.session_state['browser_session'] = db.create_session("browser_camera")
             st.session_state['browser_cam_initialized'] = True
         
@@ -385,7 +385,8 @@ if use_browser_camera:
             session_id = st.session_state['browser_session']
             
             # Run detection
-            results = detector.model(frame, conf=conf_thresh, verbose=False)
+            with detector.inference_lock:
+                results = detector.model(frame, conf=conf_thresh, verbose=False)
             annotated_frame = results[0].plot()
             
             # Display frame
@@ -393,7 +394,7 @@ if use_browser_camera:
             video_placeholder.image(frame_rgb, channels="RGB", use_container_width=True)
             
             # Get GPS
-            if gps_config['mode'] == 'realtime':
+            if gps_config.mode == 'realtime':
                 curr_lat, curr_lon = gps_manager.get_realtime_location()
             else:
                 curr_lat, curr_lon = gps_manager.get_location_at_frame(0, 30)
@@ -428,11 +429,7 @@ if use_browser_camera:
                         "image_path": None
                     }
                     
-                    damage_id = db.insert_damage(damage_data, session_id, cropped)
-                    if damage_id:
-                        record = db.get_damage_by_id(damage_id)
-                        if record:
-                            damage_data['image_path'] = record.image_path
+                    damage_data['image_path'] = db.queue_damage(damage_data, session_id, cropped)
                     
                     st.session_state['detections'].append(damage_data)
             
@@ -464,34 +461,34 @@ elif st.session_state['is_running'] and video_path is not None and video_path !=
     
     # Initialize GPS Manager
     gps_manager = GPSManager(
-        mode=gps_config.get('mode', 'simulation'),
-        start_lat=gps_config.get('start_lat', -6.9024),
-        start_lon=gps_config.get('start_lon', 107.6188)
+        mode=gps_config.mode,
+        start_lat=gps_config.start_lat,
+        start_lon=gps_config.start_lon
     )
     
     # Configure GPS based on mode
-    if gps_config['mode'] == 'realtime':
+    if gps_config.mode == 'realtime':
         gps_manager.set_realtime_mode('realtime_gps_main')
         st.info("📍 GPS Realtime Mode: Lokasi diambil dari browser Anda")
         
-    elif gps_config.get('file_path'):
-        if gps_config['mode'] == 'gpx':
-            gps_manager.load_gpx(gps_config['file_path'])
-        elif gps_config['mode'] == 'csv':
-            gps_manager.load_csv(gps_config['file_path'])
+    elif gps_config.file_path:
+        if gps_config.mode == 'gpx':
+            gps_manager.load_gpx(gps_config.file_path)
+        elif gps_config.mode == 'csv':
+            gps_manager.load_csv(gps_config.file_path)
     
     # Set manual route if applicable
-    if gps_config['mode'] == 'manual':
+    if gps_config.mode == 'manual':
         # Get total frames first (need to open video briefly)
         temp_cap = cv2.VideoCapture(video_path)
         total_frames = int(temp_cap.get(cv2.CAP_PROP_FRAME_COUNT))
         temp_cap.release()
         
         gps_manager.set_manual_route(
-            start_lat=gps_config['start_lat'],
-            start_lon=gps_config['start_lon'],
-            end_lat=gps_config['end_lat'],
-            end_lon=gps_config['end_lon'],
+            start_lat=gps_config.start_lat,
+            start_lon=gps_config.start_lon,
+            end_lat=gps_config.end_lat,
+            end_lon=gps_config.end_lon,
             total_frames=total_frames
         )
     
@@ -530,6 +527,10 @@ elif st.session_state['is_running'] and video_path is not None and video_path !=
     # For webcam/stream, total_frames might be 0
     is_stream = total_frames <= 0
     
+    # Precompute lokasi GPS semua frame (frame_count dimulai dari 1)
+    if not is_stream and gps_config.mode != 'realtime':
+        gps_manager.precompute_track(total_frames + 1, fps)
+    
     # Initialize Video Writer to save processed video with bounding boxes
     output_video_path = None
     temp_video_path = None
@@ -572,7 +573,8 @@ elif st.session_state['is_running'] and video_path is not None and video_path !=
             
             # ----- 1. DETECTION (OPTIMIZED - Skip frames) -----
             if frame_count - last_inference_frame >= INFERENCE_INTERVAL:
-                results = detector.model(frame, conf=conf_thresh, verbose=False)
+                with detector.inference_lock:
+                    results = detector.model(frame, conf=conf_thresh, verbose=False)
                 last_detection_results = results
                 last_annotated_frame = results[0].plot()
                 annotated_frame = last_annotated_frame
@@ -586,7 +588,7 @@ elif st.session_state['is_running'] and video_path is not None and video_path !=
                     annotated_frame = frame
             
             # ----- 2. GPS (OPTIMIZED - Cache untuk file-based video) -----
-            if gps_config['mode'] == 'realtime':
+            if gps_config.mode == 'realtime':
                 # Realtime GPS tidak bisa di-cache, harus setiap frame
                 curr_lat, curr_lon = gps_manager.get_location_at_frame(frame_count, fps)
             else:
@@ -659,19 +661,11 @@ elif st.session_state['is_running'] and video_path is not None and video_path !=
                             "image_path": None
                         }
                         
-                        # Save to database dan dapatkan image_path
-                        damage_id = db.insert_damage(damage_data, session_id, cropped_with_bbox)
-                        
-                        # Update dengan image_path dari database
-                        if damage_id:
-                            record = db.get_damage_by_id(damage_id)
-                            if record and record.image_path:
-                                damage_data['image_path'] = record.image_path
-                                print(f"✅ Damage {damage_id} saved with image: {record.image_path}")
-                            else:
-                                print(f"⚠️ Damage {damage_id} saved but no image path")
-                        else:
-                            print(f"❌ Failed to save damage to database")
+                        # Evidence ditulis langsung, INSERT diantrekan ke writer background
+                        damage_data['image_path'] = db.queue_damage(
+                            damage_data, session_id, cropped_with_bbox
+                        )
+                        print(f"✅ Damage {dmg['track_id']} queued with image: {damage_data['image_path']}")
                         
                         # Add to session state (dengan image_path)
                         st.session_state['detections'].append(damage_data)
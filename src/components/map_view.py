@@ -5,13 +5,35 @@ Menampilkan peta interaktif dengan berbagai fitur visualisasi.
 
 import streamlit as st
 import pandas as pd
+import numpy as np
 import folium
-import base64
 import cv2
 import os
+import copy
+import io
+from operator import attrgetter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple
 from streamlit_folium import st_folium
-from folium.plugins import MarkerCluster, HeatMap, MiniMap, Fullscreen
+from folium.plugins import FastMarkerCluster, HeatMap, MiniMap, Fullscreen
+from folium.elements import JSCSSMixin
+from folium.map import Layer
+from folium.template import Template
 from components.styling import render_icon_header
+# Base64 backend (pybase64/stdlib) dipilih sekali di modules.database
+from modules.database import _b64encode
+
+# JSON payload heatmap: orjson (native numpy) jika tersedia
+try:
+    import orjson
+
+    def _dumps_json(arr) -> str:
+        return orjson.dumps(arr, option=orjson.OPT_SERIALIZE_NUMPY).decode('utf-8')
+except ImportError:
+    import json
+
+    def _dumps_json(arr) -> str:
+        return json.dumps(arr.tolist())
 
 
 # ==========================================
@@ -24,17 +46,51 @@ def encode_image_to_base64(cv2_img) -> str:
         return ""
     try:
         _, buffer = cv2.imencode('.jpg', cv2_img)
-        jpg_as_text = base64.b64encode(buffer).decode('utf-8')
+        jpg_as_text = _b64encode(buffer).decode('utf-8')
         return jpg_as_text
     except Exception:
         return ""
 
 
+def _encode_webp(cv2_img, quality: int = 70) -> bytes:
+    """Encode gambar OpenCV ke WebP Base64 (bytes); kosong jika WebP tidak didukung"""
+    try:
+        ok, buffer = cv2.imencode('.webp', cv2_img, [cv2.IMWRITE_WEBP_QUALITY, quality])
+    except cv2.error:
+        return b""
+    return _b64encode(buffer) if ok else b""
+
+
+def _thumb_worker(cv2_img) -> Tuple[str, bytes]:
+    """
+    Resize + encode satu thumbnail popup (WebP, fallback JPEG).
+    Dijalankan di thread pool: cv2.resize/imencode melepas GIL.
+    
+    Returns:
+        (mime_type, base64_bytes)
+    """
+    try:
+        small_img = cv2.resize(cv2_img, (240, 180))
+        b64_bytes = _encode_webp(small_img)
+        if b64_bytes:
+            return "image/webp", b64_bytes
+        _, buffer = cv2.imencode('.jpg', small_img)
+        return "image/jpeg", _b64encode(buffer)
+    except Exception as e:
+        print("❌ Error encoding frame_img:", e)
+        return "image/jpeg", b""
+
+
 def load_image_from_path(image_path: str) -> str:
     """Load gambar dari file path dan konversi ke base64"""
+    return _load_image_b64(image_path).decode('ascii')
+
+
+def _load_image_b64(image_path: str) -> bytes:
+    """Load gambar dari file path sebagai base64 bytes (ASCII)"""
     if not image_path:
         print(f"⚠️ No image path provided")
-        return ""
+        return b""
     
     # Normalize path untuk cross-platform
     image_path = os.path.normpath(image_path)
@@ -47,17 +103,17 @@ def load_image_from_path(image_path: str) -> str:
             image_path = abs_path
             print(f"✅ Found using absolute path: {abs_path}")
         else:
-            return ""
+            return b""
     
     try:
         with open(image_path, 'rb') as f:
             img_data = f.read()
-            b64 = base64.b64encode(img_data).decode('utf-8')
+            b64 = _b64encode(img_data)
             print(f"✅ Loaded image from: {image_path} (size: {len(img_data)} bytes)")
             return b64
     except Exception as e:
         print(f"❌ Error loading image {image_path}: {e}")
-        return ""
+        return b""
 
 
 def get_damage_color(damage_type: str, severity: str = "medium") -> str:
@@ -98,6 +154,97 @@ def get_damage_icon(damage_type: str) -> str:
         return "camera"
 
 
+# JS callback FastMarkerCluster: row = [lat, lon, popup, tooltip, color, icon]
+_MARKER_CALLBACK = """function (row) {
+    var marker = L.marker(new L.LatLng(row[0], row[1]));
+    marker.setIcon(L.AwesomeMarkers.icon({icon: row[5], markerColor: row[4], prefix: 'fa'}));
+    marker.bindPopup(row[2], {maxWidth: 300});
+    marker.bindTooltip(row[3]);
+    return marker;
+}"""
+
+
+# Fragmen HTML popup statis (bytes UTF-8); bagian dinamis ditulis di antaranya
+_POPUP_HEAD = (
+    '<div style="font-family: \'Segoe UI\', Arial, sans-serif; min-width: 260px; padding: 5px;">'
+    '<div style="display: flex; justify-content: space-between; align-items: center;">'
+    '<h4 style="margin: 0; color: #333; font-size: 14px;">'
+).encode('utf-8')
+_POPUP_BADGE = b'</h4><span style="background: '
+_POPUP_BADGE_TEXT = (
+    b'; color: white; padding: 2px 8px; '
+    b'border-radius: 10px; font-size: 11px; font-weight: 500;">'
+)
+_POPUP_TABLE = (
+    '</span></div>'
+    '<hr style="margin: 8px 0; border: none; border-top: 1px solid #eee;">'
+    '<table style="font-size: 12px; color: #666; width: 100%;">'
+    '<tr><td>📍 Location</td><td style="text-align:right;">'
+).encode('utf-8')
+_POPUP_TIME = '</td></tr><tr><td>⏱️ Time</td><td style="text-align:right;">'.encode('utf-8')
+_POPUP_CONF = 's</td></tr><tr><td>🎯 Confidence</td><td style="text-align:right;">'.encode('utf-8')
+_POPUP_TABLE_END = b'</td></tr></table>'
+_POPUP_IMG = b'<img src="data:'
+_POPUP_IMG_B64 = b';base64,'
+_POPUP_IMG_END = (
+    b'" style="width:240px; border-radius:8px; margin-top:8px; '
+    b'box-shadow: 0 2px 8px rgba(0,0,0,0.2);">'
+)
+_POPUP_TAIL = b'</div>'
+
+
+def _write_popup_html(buf, dtype, sev, sev_color, lat, lon, ts, conf_str, mime, b64_bytes):
+    """
+    Tulis HTML popup satu marker kerusakan ke buffer BytesIO.
+    Base64 gambar ditulis langsung sebagai bytes ASCII (tanpa decode ke str).
+    """
+    buf.write(_POPUP_HEAD)
+    buf.write(dtype.encode('utf-8'))
+    buf.write(_POPUP_BADGE)
+    buf.write(sev_color.encode('ascii'))
+    buf.write(_POPUP_BADGE_TEXT)
+    buf.write(sev.upper().encode('utf-8'))
+    buf.write(_POPUP_TABLE)
+    buf.write(f"{lat:.6f}, {lon:.6f}".encode('ascii'))
+    buf.write(_POPUP_TIME)
+    buf.write(f"{ts:.2f}".encode('ascii'))
+    buf.write(_POPUP_CONF)
+    buf.write(conf_str.encode('utf-8'))
+    buf.write(_POPUP_TABLE_END)
+    if b64_bytes:
+        buf.write(_POPUP_IMG)
+        buf.write(mime.encode('ascii'))
+        buf.write(_POPUP_IMG_B64)
+        buf.write(b64_bytes)
+        buf.write(_POPUP_IMG_END)
+    buf.write(_POPUP_TAIL)
+
+
+class _HeatLayer(JSCSSMixin, Layer):
+    """
+    Layer Leaflet.heat dengan data JSON mentah.
+    Payload sudah diserialisasi sekali di Python dan disisipkan apa adanya
+    ke template, tanpa validasi/templating per titik seperti HeatMap.
+    """
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.heatLayer(
+                {{ this.payload }},
+                {{ this.options|tojson }}
+            );
+        {% endmacro %}
+        """
+    )
+    default_js = HeatMap.default_js
+
+    def __init__(self, payload: str, name=None, **options):
+        super().__init__(name=name, overlay=True, control=True, show=True)
+        self._name = "HeatMap"
+        self.payload = payload
+        self.options = options
+
+
 # ==========================================
 # LIVE MAP (Real-time tracking)
 # ==========================================
@@ -133,7 +280,31 @@ def update_live_map(placeholder, detections: list):
 # ANALYSIS MAP (Full featured)
 # ==========================================
 
-def render_analysis_map(detections: list, db=None, show_filters: bool = True):
+@st.cache_resource
+def _base_map(center_lat: float, center_lon: float) -> folium.Map:
+    """
+    Template peta dasar (tile layers + plugins) yang tidak bergantung pada data.
+    Di-cache per center (dibulatkan 3 desimal); caller wajib deepcopy sebelum menambah layer.
+    """
+    # Pilih tile layer
+    m = folium.Map(
+        location=[center_lat, center_lon], 
+        zoom_start=15,
+        tiles="CartoDB dark_matter"
+    )
+    
+    # Tambah layer alternatif
+    folium.TileLayer('CartoDB positron', name='Light Mode').add_to(m)
+    folium.TileLayer('OpenStreetMap', name='Street Map').add_to(m)
+    
+    # Add plugins
+    Fullscreen(position='topleft').add_to(m)
+    MiniMap(toggle_display=True).add_to(m)
+    
+    return m
+
+
+def render_analysis_map(detections, db=None, show_filters: bool = True):
     """
     Render peta analisis lengkap dengan fitur:
     - Filter by damage type
@@ -144,16 +315,16 @@ def render_analysis_map(detections: list, db=None, show_filters: bool = True):
     - Export options
     
     Args:
-        detections: List of detection dicts (dari session_state atau database)
+        detections: List of detection dicts (session_state) atau DataFrame (database)
         db: Optional DamageDatabase instance untuk load image dari file
         show_filters: Tampilkan panel filter atau tidak
     """
-    if not detections:
+    if detections is None or len(detections) == 0:
         st.info("📍 No damage data available for mapping. Start an inspection first!")
         return
     
     # Convert to DataFrame
-    df = pd.DataFrame(detections)
+    df = detections if isinstance(detections, pd.DataFrame) else pd.DataFrame(detections)
     
     # Pastikan kolom yang dibutuhkan ada
     required_cols = ['lat', 'lon', 'type']
@@ -170,6 +341,10 @@ def render_analysis_map(detections: list, db=None, show_filters: bool = True):
     if 'conf' not in df.columns:
         df['conf'] = 0.5
     
+    # Kardinalitas rendah -> categorical (isin/groupby jalan di kode int8)
+    df['type'] = df['type'].astype('category')
+    df['severity'] = df['severity'].astype('category')
+    
     st.markdown("---")
     st.subheader("📋 Damage Analysis Report")
     
@@ -227,40 +402,32 @@ def render_analysis_map(detections: list, db=None, show_filters: bool = True):
     center_lat = df_filtered['lat'].mean()
     center_lon = df_filtered['lon'].mean()
     
-    # Pilih tile layer
-    m = folium.Map(
-        location=[center_lat, center_lon], 
-        zoom_start=15,
-        tiles="CartoDB dark_matter"
-    )
-    
-    # Tambah layer alternatif
-    folium.TileLayer('CartoDB positron', name='Light Mode').add_to(m)
-    folium.TileLayer('OpenStreetMap', name='Street Map').add_to(m)
-    
-    # Add plugins
-    Fullscreen(position='topleft').add_to(m)
-    MiniMap(toggle_display=True).add_to(m)
+    # Base map (tile layer + plugin) dari cache, di-copy agar template tidak termodifikasi
+    m = copy.deepcopy(_base_map(round(center_lat, 3), round(center_lon, 3)))
     
     # ==========================================
     # HEATMAP LAYER
     # ==========================================
     if view_mode in ["Heatmap", "Both"]:
-        heat_data = df_filtered[['lat', 'lon']].values.tolist()
-        
         # Weight by severity
         weights = df_filtered['severity'].map({
             'high': 1.0,
             'medium': 0.6,
             'low': 0.3
-        }).fillna(0.5).tolist()
+        }).astype(float).fillna(0.5)
         
-        heat_data_weighted = [[row[0], row[1], w] for row, w in zip(heat_data, weights)]
+        heat_data_weighted = np.column_stack([
+            df_filtered['lat'].to_numpy(dtype=float),
+            df_filtered['lon'].to_numpy(dtype=float),
+            weights.to_numpy()
+        ])
         
-        HeatMap(
-            heat_data_weighted,
-            min_opacity=0.3,
-            max_zoom=18,
+        # Serialisasi sekali ke JSON, heatmap digambar Leaflet.heat di browser
+        _HeatLayer(
+            _dumps_json(heat_data_weighted),
+            name="Heatmap",
+            minOpacity=0.3,
+            maxZoom=18,
             radius=25,
             blur=15,
             gradient={0.4: 'blue', 0.65: 'lime', 0.8: 'orange', 1: 'red'}
@@ -270,92 +437,68 @@ def render_analysis_map(detections: list, db=None, show_filters: bool = True):
     # MARKER LAYER
     # ==========================================
     if view_mode in ["Markers", "Both"]:
-        marker_cluster = MarkerCluster(name="Damage Points").add_to(m)
+        # Encode thumbnail frame_img secara paralel sebelum membangun marker
+        thumbs = {}
+        if 'frame_img' in df_filtered.columns:
+            frame_imgs = [
+                (idx, img) for idx, img in df_filtered['frame_img'].items()
+                if img is not None and hasattr(img, 'shape')
+            ]
+            if frame_imgs:
+                idxs, imgs = zip(*frame_imgs)
+                with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+                    thumbs = dict(zip(idxs, ex.map(_thumb_worker, imgs)))
         
-        for idx, row in df_filtered.iterrows():
-            # Prepare image HTML
-            img_html = ""
-            
-            # Debug: print row data
-            print("\n=== Processing marker", idx, "===")
-            print("Type:", row.get('type'))
-            print("Has frame_img:", 'frame_img' in row and row['frame_img'] is not None)
-            print("Has image_path:", 'image_path' in row and row.get('image_path'))
-            if 'image_path' in row:
-                print("Image path value:", row['image_path'])
-            
-            # Cek apakah ada gambar dari frame_img (memory)
-            if 'frame_img' in row and row['frame_img'] is not None:
-                try:
-                    small_img = cv2.resize(row['frame_img'], (240, 180))
-                    b64_str = encode_image_to_base64(small_img)
-                    if b64_str:
-                        img_html = f'''
-                        <img src="data:image/jpeg;base64,{b64_str}" 
-                             style="width:240px; border-radius:8px; margin-top:8px; box-shadow: 0 2px 8px rgba(0,0,0,0.2);">
-                        '''
-                        print("✅ Using frame_img (memory)")
-                except Exception as e:
-                    print("❌ Error encoding frame_img:", e)
-            
-            # Atau dari image_path (database)
-            elif 'image_path' in row and row['image_path']:
-                print("Attempting to load from path:", row['image_path'])
-                b64_str = load_image_from_path(row['image_path'])
-                if b64_str:
-                    img_html = f'''
-                    <img src="data:image/jpeg;base64,{b64_str}" 
-                         style="width:240px; border-radius:8px; margin-top:8px; box-shadow: 0 2px 8px rgba(0,0,0,0.2);">
-                    '''
-                    print("✅ Using image_path (database)")
-                else:
-                    print("❌ Failed to load image from path")
+        if 'image_path' in df_filtered.columns:
+            image_paths = df_filtered['image_path']
+        else:
+            image_paths = pd.Series(None, index=df_filtered.index, dtype=object)
+        
+        # Data marker dibangun sebagai array mentah, marker dibuat di browser
+        # [lat, lon, popup_html, tooltip, marker_color, marker_icon]
+        # Semua popup ditulis ke satu buffer, lalu di-slice per marker via offset
+        marker_data = []
+        offsets = []
+        buf = io.BytesIO()
+        for idx, dtype, sev, lat, lon, ts, conf, img_path in zip(
+            df_filtered.index, df_filtered['type'], df_filtered['severity'],
+            df_filtered['lat'], df_filtered['lon'], df_filtered['timestamp'],
+            df_filtered['conf'], image_paths
+        ):
+            # Image: frame_img (memory) atau image_path (database)
+            mime, b64_bytes = thumbs.get(idx, ("image/jpeg", b""))
+            if not b64_bytes and isinstance(img_path, str) and img_path:
+                mime, b64_bytes = "image/jpeg", _load_image_b64(img_path)
             
             # Severity badge color
-            sev = row.get('severity', 'medium')
             sev_color = {'high': '#dc3545', 'medium': '#fd7e14', 'low': '#28a745'}.get(sev, '#6c757d')
             
             # Confidence
-            conf = row.get('conf', 0)
             if isinstance(conf, (int, float)):
                 conf_str = f"{conf:.1%}"
             else:
                 conf_str = str(conf)
             
-            # Build popup HTML
-            popup_html = f"""
-            <div style="font-family: 'Segoe UI', Arial, sans-serif; min-width: 260px; padding: 5px;">
-                <div style="display: flex; justify-content: space-between; align-items: center;">
-                    <h4 style="margin: 0; color: #333; font-size: 14px;">{row['type']}</h4>
-                    <span style="background: {sev_color}; color: white; padding: 2px 8px; 
-                                 border-radius: 10px; font-size: 11px; font-weight: 500;">
-                        {sev.upper()}
-                    </span>
-                </div>
-                <hr style="margin: 8px 0; border: none; border-top: 1px solid #eee;">
-                <table style="font-size: 12px; color: #666; width: 100%;">
-                    <tr><td>📍 Location</td><td style="text-align:right;">{row['lat']:.6f}, {row['lon']:.6f}</td></tr>
-                    <tr><td>⏱️ Time</td><td style="text-align:right;">{row['timestamp']:.2f}s</td></tr>
-                    <tr><td>🎯 Confidence</td><td style="text-align:right;">{conf_str}</td></tr>
-                </table>
-                {img_html}
-            </div>
-            """
-            
-            # Get marker color and icon
-            marker_color = get_damage_color(row['type'], sev)
-            marker_icon = get_damage_icon(row['type'])
+            begin = buf.tell()
+            _write_popup_html(buf, dtype, sev, sev_color, lat, lon, ts, conf_str, mime, b64_bytes)
+            offsets.append((begin, buf.tell()))
             
-            folium.Marker(
-                location=[row['lat'], row['lon']],
-                popup=folium.Popup(popup_html, max_width=300),
-                tooltip=f"{row['type']} ({sev})",
-                icon=folium.Icon(
-                    color=marker_color, 
-                    icon=marker_icon, 
-                    prefix="fa"
-                )
-            ).add_to(marker_cluster)
+            marker_data.append([
+                lat, lon, None, f"{dtype} ({sev})",
+                get_damage_color(dtype, sev), get_damage_icon(dtype)
+            ])
+        
+        # Decode UTF-8 sekali per popup langsung dari buffer (tanpa salinan getvalue)
+        popups = buf.getbuffer()
+        for row, (begin, end) in zip(marker_data, offsets):
+            row[2] = str(popups[begin:end], 'utf-8')
+        popups.release()
+        
+        FastMarkerCluster(
+            marker_data,
+            callback=_MARKER_CALLBACK,
+            name="Damage Points"
+        ).add_to(m)
     
     # Layer control
     folium.LayerControl().add_to(m)
@@ -380,14 +523,23 @@ def render_analysis_map(detections: list, db=None, show_filters: bool = True):
     
     # Damage type breakdown
     st.markdown("#### Damage Type Distribution")
-    type_counts = df_filtered['type'].value_counts()
-    
-    # Simple bar visualization
-    for dtype, count in type_counts.items():
-        pct = count / len(df_filtered) * 100
-        col1, col2 = st.columns([3, 1])
-        col1.progress(pct / 100, text=f"{dtype}")
-        col2.write(f"{count} ({pct:.1f}%)")
+    type_stats = df_filtered.groupby('type', observed=True).size().rename('count').reset_index()
+    type_stats = type_stats.sort_values('count', ascending=False)
+    type_stats['pct'] = type_stats['count'] / type_stats['count'].sum() * 100
+    
+    # Satu widget tabel dengan progress bar, bukan 2 widget per tipe
+    st.dataframe(
+        type_stats,
+        column_config={
+            'type': st.column_config.TextColumn("Damage Type"),
+            'count': st.column_config.NumberColumn("Count"),
+            'pct': st.column_config.ProgressColumn(
+                "Share", format="%.1f%%", min_value=0, max_value=100
+            ),
+        },
+        width='stretch',
+        hide_index=True
+    )
     
     # ==========================================
     # DATA TABLE
@@ -397,19 +549,28 @@ def render_analysis_map(detections: list, db=None, show_filters: bool = True):
     # Buat tampilan tabel yang lebih bersih
     display_df = df_filtered.drop(columns=['frame_img'], errors='ignore').copy()
     
-    # Format columns
-    if 'timestamp' in display_df.columns:
-        display_df['timestamp'] = display_df['timestamp'].apply(lambda x: f"{x:.2f}s")
-    if 'conf' in display_df.columns:
-        display_df['conf'] = display_df['conf'].apply(
-            lambda x: f"{x:.1%}" if isinstance(x, (int, float)) else x
-        )
-    if 'lat' in display_df.columns:
-        display_df['lat'] = display_df['lat'].apply(lambda x: f"{x:.6f}")
-    if 'lon' in display_df.columns:
-        display_df['lon'] = display_df['lon'].apply(lambda x: f"{x:.6f}")
+    # Format columns: nilai tetap numerik (vectorized), format via column_config
+    column_config = {
+        'timestamp': st.column_config.NumberColumn(format="%.2fs"),
+        'lat': st.column_config.NumberColumn(format="%.6f"),
+        'lon': st.column_config.NumberColumn(format="%.6f"),
+    }
+    if 'conf' in display_df.columns and pd.api.types.is_numeric_dtype(display_df['conf']):
+        display_df['conf'] = (display_df['conf'] * 100).round(1)
+        column_config['conf'] = st.column_config.NumberColumn(format="%.1f%%")
     
-    st.dataframe(display_df, width='stretch', hide_index=True)
+    st.dataframe(display_df, column_config=column_config, width='stretch', hide_index=True)
+
+
+# Atribut DamageRecord -> kolom DataFrame peta
+_HISTORY_FIELDS = attrgetter(
+    'id', 'latitude', 'longitude', 'damage_type', 'timestamp',
+    'confidence', 'severity', 'image_path', 'session_id', 'created_at'
+)
+_HISTORY_COLUMNS = [
+    'id', 'lat', 'lon', 'type', 'timestamp',
+    'conf', 'severity', 'image_path', 'session_id', 'created_at'
+]
 
 
 def render_history_map(db, session_id: str = None):
@@ -429,20 +590,9 @@ def render_history_map(db, session_id: str = None):
         st.info("No historical data available.")
         return
     
-    # Convert records to list of dicts
-    detections = []
-    for rec in records:
-        detections.append({
-            'id': rec.id,
-            'lat': rec.latitude,
-            'lon': rec.longitude,
-            'type': rec.damage_type,
-            'timestamp': rec.timestamp,
-            'conf': rec.confidence,
-            'severity': rec.severity,
-            'image_path': rec.image_path,
-            'session_id': rec.session_id,
-            'created_at': rec.created_at
-        })
-    
-    render_analysis_map(detections, db=db, show_filters=True)
+    # Records -> DataFrame langsung (tanpa dict per baris)
+    df = pd.DataFrame.from_records(
+        map(_HISTORY_FIELDS, records), columns=_HISTORY_COLUMNS
+    )
+    
+    render_analysis_map(df, db=db, show_filters=True)
@@ -1,3 +1,5 @@
+import html
+import re
 import streamlit as st
 
 # 1. KOLEKSI ICON SVG (Gaya Lucide/Modern)
@@ -10,72 +12,82 @@ ICONS = {
 }
 
 # 2. LOAD CSS (GLASSMORPHISM)
-def load_css():
-    st.markdown("""
-        <style>
-        /* Background Gelap Elegan */
-        .stApp {
-            background: linear-gradient(to bottom right, #0f2027, #203a43, #2c5364); 
-            color: #e0e0e0;
-        }
-        
-        /* Card Glassmorphism */
-        .glass-card {
-            background: rgba(255, 255, 255, 0.05);
-            backdrop-filter: blur(10px);
-            -webkit-backdrop-filter: blur(10px);
-            border: 1px solid rgba(255, 255, 255, 0.1);
-            border-radius: 12px;
-            padding: 15px;
-            margin-bottom: 15px;
-            box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-        }
+_CSS_RAW = """
+/* Background Gelap Elegan */
+.stApp {
+    background: linear-gradient(to bottom right, #0f2027, #203a43, #2c5364); 
+    color: #e0e0e0;
+}
 
-        /* HANYA SEMBUNYIKAN MENU & FOOTER, JANGAN HEADER */
-        #MainMenu {visibility: hidden;} 
-        footer {visibility: hidden;}
-        
-        /* Jika ingin header transparan tapi tombol sidebar tetap ada: */
-        header[data-testid="stHeader"] {
-            background-color: transparent;
-        }
-        
-        /* Opsional: Sembunyikan garis pelangi di atas jika mengganggu */
-        .stApp > header {
-            background-color: transparent;
-        }
+/* Card Glassmorphism */
+.glass-card {
+    background: rgba(255, 255, 255, 0.05);
+    backdrop-filter: blur(10px);
+    -webkit-backdrop-filter: blur(10px);
+    border: 1px solid rgba(255, 255, 255, 0.1);
+    border-radius: 12px;
+    padding: 15px;
+    margin-bottom: 15px;
+    box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
+}
 
-        /* ... (Styling Judul & Metrik tetap sama) ... */
-        .header-title {
-            font-family: 'Helvetica Neue', sans-serif;
-            font-weight: 700;
-            font-size: 1.8rem;
-            background: -webkit-linear-gradient(#00e5ff, #0072ff);
-            -webkit-background-clip: text;
-            -webkit-text-fill-color: transparent;
-            margin-bottom: 0px;
-        }
-        
-        .header-subtitle {
-            font-size: 0.9rem;
-            color: #a0a0a0;
-            margin-bottom: 20px;
-        }
+/* HANYA SEMBUNYIKAN MENU & FOOTER, JANGAN HEADER */
+#MainMenu {visibility: hidden;} 
+footer {visibility: hidden;}
 
-        div[data-testid="stMetricValue"] {
-            font-size: 24px;
-            color: #00e5ff;
-            text-shadow: 0 0 10px rgba(0, 229, 255, 0.3);
-        }
-        </style>
-        """, unsafe_allow_html=True)
+/* Jika ingin header transparan tapi tombol sidebar tetap ada: */
+header[data-testid="stHeader"] {
+    background-color: transparent;
+}
+
+/* Opsional: Sembunyikan garis pelangi di atas jika mengganggu */
+.stApp > header {
+    background-color: transparent;
+}
+
+/* ... (Styling Judul & Metrik tetap sama) ... */
+.header-title {
+    font-family: 'Helvetica Neue', sans-serif;
+    font-weight: 700;
+    font-size: 1.8rem;
+    background: -webkit-linear-gradient(#00e5ff, #0072ff);
+    -webkit-background-clip: text;
+    -webkit-text-fill-color: transparent;
+    margin-bottom: 0px;
+}
+
+.header-subtitle {
+    font-size: 0.9rem;
+    color: #a0a0a0;
+    margin-bottom: 20px;
+}
+
+div[data-testid="stMetricValue"] {
+    font-size: 24px;
+    color: #00e5ff;
+    text-shadow: 0 0 10px rgba(0, 229, 255, 0.3);
+}
+"""
+
+# Minify sekali saat import (hapus komentar & whitespace) -> payload rerun lebih kecil
+_CSS_MIN = "<style>" + re.sub(
+    r"\s*([{};:,>])\s*", r"\1",
+    re.sub(r"\s+", " ", re.sub(r"/\*.*?\*/", "", _CSS_RAW, flags=re.S))
+).strip() + "</style>"
+
+def load_css():
+    st.markdown(_CSS_MIN, unsafe_allow_html=True)
 
 # 3. HELPER FUNCTION UNTUK HEADER DENGAN ICON
+# Template HTML header per icon dibangun sekali saat import
+_HEADER_OPEN = '<div style="display: flex; align-items: center; gap: 8px; margin-bottom: 10px;">'
+_HEADER_CLOSE = '<span style="font-size: 1.1rem; font-weight: 600;">{text}</span></div>'
+_HEADER_TEMPLATES = {
+    name: _HEADER_OPEN + svg.replace("{", "{{").replace("}", "}}") + _HEADER_CLOSE
+    for name, svg in ICONS.items()
+}
+_HEADER_DEFAULT = _HEADER_OPEN + _HEADER_CLOSE
+
 def render_icon_header(icon_name, text):
-    svg = ICONS.get(icon_name, "")
-    st.markdown(f"""
-    <div style="display: flex; align-items: center; gap: 8px; margin-bottom: 10px;">
-        {svg}
-        <span style="font-size: 1.1rem; font-weight: 600;">{text}</span>
-    </div>
-    """, unsafe_allow_html=True)
\ No newline at end of file
+    tpl = _HEADER_TEMPLATES.get(icon_name, _HEADER_DEFAULT)
+    st.markdown(tpl.format(text=html.escape(text)), unsafe_allow_html=True)
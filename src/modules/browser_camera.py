@@ -5,62 +5,72 @@ Tidak perlu install app di HP - cukup buka di browser.
 """
 
 import streamlit as st
+import importlib.util
 import cv2
 import numpy as np
-from typing import Optional, Callable
+from typing import Optional, Callable, Final
 import threading
-import queue
 import time
 
-# Try import streamlit-webrtc
-try:
-    from streamlit_webrtc import webrtc_streamer, WebRtcMode, VideoProcessorBase
-    import av
-    HAS_WEBRTC = True
-except ImportError:
-    HAS_WEBRTC = False
+# Cek streamlit-webrtc/av tanpa meng-import (PyAV + FFmpeg berat saat cold start);
+# import sebenarnya ditunda sampai kamera browser dipakai (_lazy_webrtc)
+HAS_WEBRTC = (
+    importlib.util.find_spec("streamlit_webrtc") is not None
+    and importlib.util.find_spec("av") is not None
+)
+if not HAS_WEBRTC:
     print("⚠️ streamlit-webrtc not installed. Run: pip install streamlit-webrtc av")
 
+_webrtc = None  # (webrtc_streamer, WebRtcMode, RoadDamageProcessor) setelah import
+
 
 class FrameQueue:
-    """Thread-safe queue untuk frame dari browser camera"""
+    """
+    Slot frame terbaru dari browser camera (single-producer).
+    Konsumen hanya butuh frame terbaru, jadi cukup satu referensi:
+    assignment atribut bersifat atomik di bawah GIL, tanpa lock/queue.
+    """
+    
+    __slots__ = ('latest_frame',)
     
-    def __init__(self, maxsize: int = 5):
-        self.queue = queue.Queue(maxsize=maxsize)
+    def __init__(self, maxsize: int = 1):
+        # maxsize dipertahankan untuk kompatibilitas; frame lama selalu di-drop
         self.latest_frame = None
-        self.lock = threading.Lock()
     
     def put(self, frame):
-        """Add frame ke queue"""
-        with self.lock:
-            self.latest_frame = frame
-            try:
-                # Non-blocking put, drop old frames jika penuh
-                self.queue.put_nowait(frame)
-            except queue.Full:
-                try:
-                    self.queue.get_nowait()
-                    self.queue.put_nowait(frame)
-                except:
-                    pass
+        """Ganti frame terbaru"""
+        self.latest_frame = frame
     
     def get(self, timeout: float = 0.1) -> Optional[np.ndarray]:
-        """Get frame dari queue"""
-        try:
-            return self.queue.get(timeout=timeout)
-        except queue.Empty:
-            with self.lock:
-                return self.latest_frame
+        """Get frame terbaru"""
+        return self.latest_frame
     
     def get_latest(self) -> Optional[np.ndarray]:
         """Get frame terbaru (non-blocking)"""
-        with self.lock:
-            return self.latest_frame
+        return self.latest_frame
+
+
+# Petunjuk kamera HP (konstanta, tidak dibuat ulang setiap rerun)
+_CAMERA_HELP_MD: Final = """
+📱 **Cara menggunakan kamera HP:**
+1. Buka URL aplikasi ini di browser HP (Chrome/Safari)
+2. Izinkan akses kamera saat diminta
+3. Klik START untuk mulai streaming
+
+💡 Pastikan HP dan laptop di jaringan WiFi yang sama!
+"""
+
+# Lebar frame browser camera untuk inference (ukuran input model YOLO)
+_INFER_WIDTH = 640
+
+# Warna bbox (BGR) untuk anotasi frame browser camera
+_BOX_COLOR = (0, 255, 0)
 
 
 # Global frame queue untuk sharing antar components
 _frame_queue = FrameQueue()
 _is_streaming = False
+_last_processed_frame = None  # frame terakhir yang sudah diproses deteksi
 
 
 def get_frame_queue() -> FrameQueue:
@@ -73,7 +83,9 @@ def is_browser_camera_active() -> bool:
     return _is_streaming
 
 
-if HAS_WEBRTC:
+def _make_processor_class(VideoProcessorBase, av):
+    """Bangun class RoadDamageProcessor setelah streamlit-webrtc di-import"""
+    
     class RoadDamageProcessor(VideoProcessorBase):
         """
         Video processor untuk streamlit-webrtc.
@@ -95,8 +107,16 @@ if HAS_WEBRTC:
             # Convert ke numpy array (BGR)
             img = frame.to_ndarray(format="bgr24")
             
-            # Put ke queue untuk processing di main thread
-            self.frame_queue.put(img.copy())
+            # Kamera bisa mengabaikan constraint "ideal": perkecil ke lebar inference
+            # (FLOPs model sebanding jumlah piksel)
+            h, w = img.shape[:2]
+            if w > _INFER_WIDTH:
+                img = cv2.resize(img, (_INFER_WIDTH, int(h * _INFER_WIDTH / w)),
+                                 interpolation=cv2.INTER_AREA)
+            
+            # Serahkan array ke consumer tanpa copy: to_ndarray membuat buffer baru
+            # per frame dan recv tidak memakai `img` lagi setelah ini
+            self.frame_queue.put(img)
             
             # Return frame untuk display (bisa sudah di-annotate)
             with self.lock:
@@ -113,6 +133,27 @@ if HAS_WEBRTC:
         def __del__(self):
             global _is_streaming
             _is_streaming = False
+    
+    return RoadDamageProcessor
+
+
+def _lazy_webrtc():
+    """
+    Import streamlit-webrtc + av saat pertama kali dibutuhkan.
+    
+    Returns:
+        Tuple (webrtc_streamer, WebRtcMode, RoadDamageProcessor), atau None jika tidak tersedia
+    """
+    global _webrtc, HAS_WEBRTC
+    if _webrtc is None and HAS_WEBRTC:
+        try:
+            from streamlit_webrtc import webrtc_streamer, WebRtcMode, VideoProcessorBase
+            import av
+        except ImportError:
+            HAS_WEBRTC = False
+            return None
+        _webrtc = (webrtc_streamer, WebRtcMode, _make_processor_class(VideoProcessorBase, av))
+    return _webrtc
 
 
 def render_browser_camera(key: str = "browser_cam"):
@@ -122,19 +163,14 @@ def render_browser_camera(key: str = "browser_cam"):
     Returns:
         webrtc_ctx: WebRTC context object, atau None jika tidak tersedia
     """
-    if not HAS_WEBRTC:
+    webrtc = _lazy_webrtc()
+    if webrtc is None:
         st.error("❌ streamlit-webrtc tidak terinstall!")
         st.code("pip install streamlit-webrtc av", language="bash")
         return None
+    webrtc_streamer, WebRtcMode, RoadDamageProcessor = webrtc
     
-    st.info("""
-    📱 **Cara menggunakan kamera HP:**
-    1. Buka URL aplikasi ini di browser HP (Chrome/Safari)
-    2. Izinkan akses kamera saat diminta
-    3. Klik START untuk mulai streaming
-    
-    💡 Pastikan HP dan laptop di jaringan WiFi yang sama!
-    """)
+    st.info(_CAMERA_HELP_MD)
     
     # WebRTC configuration
     rtc_configuration = {
@@ -148,8 +184,8 @@ def render_browser_camera(key: str = "browser_cam"):
     media_constraints = {
         "video": {
             "facingMode": {"ideal": "environment"},  # Rear camera
-            "width": {"ideal": 1280},
-            "height": {"ideal": 720},
+            "width": {"ideal": _INFER_WIDTH},
+            "height": {"ideal": 480},
             "frameRate": {"ideal": 15, "max": 30}
         },
         "audio": False
@@ -173,11 +209,11 @@ def render_simple_browser_camera(key: str = "simple_cam"):
     Render versi simple dari browser camera.
     Hanya capture frame, tidak perlu processor.
     """
-    if not HAS_WEBRTC:
+    webrtc = _lazy_webrtc()
+    if webrtc is None:
         st.error("❌ streamlit-webrtc tidak terinstall!")
         return None
-    
-    from streamlit_webrtc import webrtc_streamer, WebRtcMode
+    webrtc_streamer, WebRtcMode, _ = webrtc
     
     ctx = webrtc_streamer(
         key=key,
@@ -229,26 +265,51 @@ def process_browser_camera_stream(
     Returns:
         dict dengan stats dan deteksi
     """
+    global _last_processed_frame
     frame = get_browser_frame()
     
     if frame is None:
         return None
     
+    # Frame belum berganti sejak panggilan terakhir (rerun lebih cepat dari kamera):
+    # lewati inference. Referensi disimpan agar identitas objek tidak dipakai ulang.
+    if frame is _last_processed_frame:
+        return {
+            "frame": frame,
+            "detections": [],
+            "new_damages": [],
+            "location": gps_manager.get_realtime_location()
+        }
+    _last_processed_frame = frame
+    
     # Run detection
-    results = detector.model(frame, conf=conf_thresh, verbose=False)
-    annotated_frame = results[0].plot()
+    with detector.inference_lock:
+        results = detector.model(frame, conf=conf_thresh, verbose=False)
+    
+    # Gambar bbox langsung di frame (frame milik consumer, lihat recv),
+    # tanpa alokasi frame baru dari results[0].plot()
+    annotated_frame = frame
     
     # Get GPS location
     curr_lat, curr_lon = gps_manager.get_realtime_location()
     
     # Process detections
     frame_detections = []
-    if results[0].boxes:
-        for box in results[0].boxes:
-            xyxy = box.xyxy[0].tolist()
-            cls_id = int(box.cls[0])
-            conf = float(box.conf[0])
-            label = detector.model.names[cls_id]
+    boxes = results[0].boxes
+    if boxes is not None and len(boxes):
+        # Satu transfer device->CPU per tensor, bukan per box
+        xyxy_all = boxes.xyxy.cpu().numpy()
+        cls_all = boxes.cls.cpu().numpy().astype(np.int32)
+        conf_all = boxes.conf.cpu().numpy()
+        names = detector.model.names
+        for xyxy_row, cls_id, conf in zip(xyxy_all, cls_all, conf_all.tolist()):
+            xyxy = xyxy_row.tolist()
+            label = names[int(cls_id)]
+            
+            x1, y1, x2, y2 = map(int, xyxy)
+            cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), _BOX_COLOR, 2)
+            cv2.putText(annotated_frame, f"{label} {conf:.2f}", (x1, max(y1 - 6, 12)),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, _BOX_COLOR, 1, cv2.LINE_AA)
             
             frame_detections.append({
                 "bbox": xyxy,
@@ -259,12 +320,19 @@ def process_browser_camera_stream(
     # Update tracker
     new_damages = tracker.update(frame_detections, (curr_lat, curr_lon))
     
+    # Crop region semua damage baru: margin 20px + clamp ke ukuran frame sekaligus
+    crop_boxes = np.array(
+        [d['bbox'] for d in new_damages], dtype=np.float64
+    ).reshape(-1, 4).astype(np.int32)
+    crop_boxes[:, :2] -= 20
+    crop_boxes[:, 2:] += 20
+    h, w = annotated_frame.shape[:2]
+    np.clip(crop_boxes[:, 0::2], 0, w, out=crop_boxes[:, 0::2])
+    np.clip(crop_boxes[:, 1::2], 0, h, out=crop_boxes[:, 1::2])
+    
     # Save new damages
-    for dmg in new_damages:
+    for dmg, (x1, y1, x2, y2) in zip(new_damages, crop_boxes):
         # Crop image
-        x1, y1, x2, y2 = [int(c) for c in dmg['bbox']]
-        x1, y1 = max(0, x1-20), max(0, y1-20)
-        x2, y2 = min(annotated_frame.shape[1], x2+20), min(annotated_frame.shape[0], y2+20)
         cropped = annotated_frame[y1:y2, x1:x2]
         
         damage_data = {
@@ -278,7 +346,8 @@ def process_browser_camera_stream(
             "severity": "medium"
         }
         
-        damage_id = db.insert_damage(damage_data, session_id, cropped)
+        # Evidence crop ditulis langsung, INSERT di-batch oleh writer database
+        damage_data['image_path'] = db.queue_damage(damage_data, session_id, cropped)
         
         if on_damage_detected:
             on_damage_detected(damage_data)
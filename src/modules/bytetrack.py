@@ -4,7 +4,7 @@ ByteTrack Implementation for Road Damage Detection - FIXED VERSION
 
 import numpy as np
 from collections import defaultdict
-from dataclasses import dataclass, field
+from dataclasses import dataclass
 from typing import Dict, List, Tuple, Optional
 from math import radians, cos, sin, asin, sqrt
 
@@ -16,60 +16,242 @@ except ImportError:
     HAS_SCIPY = False
     print("[WARNING] scipy not found, using greedy matching")
 
+# KD-tree untuk dedup lokasi (bagian dari scipy, fallback scan linear)
+try:
+    from scipy.spatial import cKDTree
+    HAS_KDTREE = True
+except ImportError:
+    HAS_KDTREE = False
 
-class KalmanFilter:
-    """Simple Kalman Filter for bbox tracking"""
+# lap (LAPJV) opsional: lebih cepat untuk cost matrix yang sparse setelah gating
+try:
+    import lap
+    HAS_LAP = True
+except ImportError:
+    HAS_LAP = False
+
+# joblib opsional: tracking offline per window secara paralel
+try:
+    from joblib import Parallel, delayed
+    HAS_JOBLIB = True
+except ImportError:
+    HAS_JOBLIB = False
+
+# Numba opsional: kernel Kalman & cost matrix di-JIT, fallback ke NumPy
+try:
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+
+def _iou_matrix(tracks_xyxy: np.ndarray, dets_xyxy: np.ndarray) -> np.ndarray:
+    """
+    IoU berpasangan (N, M) antara bbox track dan deteksi via broadcasting.
     
-    def __init__(self):
-        self.F = np.eye(8)
-        self.F[0, 4] = 1
-        self.F[1, 5] = 1
-        self.F[2, 6] = 1
+    Args:
+        tracks_xyxy: Array (N, 4) format [x1, y1, x2, y2]
+        dets_xyxy: Array (M, 4) format [x1, y1, x2, y2]
         
-        self.H = np.eye(4, 8)
-        self.Q = np.eye(8) * 0.1
-        self.R = np.eye(4) * 1.0
-        
-        self.x = np.zeros(8)
-        self.P = np.eye(8) * 10
+    Returns:
+        Array (N, M) nilai IoU
+    """
+    t, d = tracks_xyxy, dets_xyxy
     
-    def init(self, bbox: List[float]):
-        cx = (bbox[0] + bbox[2]) / 2
-        cy = (bbox[1] + bbox[3]) / 2
-        w = bbox[2] - bbox[0]
-        h = bbox[3] - bbox[1]
-        
-        self.x = np.array([cx, cy, w * h, w / max(h, 1), 0, 0, 0, 0])
-        self.P = np.eye(8) * 10
+    inter_w = np.minimum(t[:, None, 2], d[None, :, 2])
+    np.subtract(inter_w, np.maximum(t[:, None, 0], d[None, :, 0]), out=inter_w)
+    np.maximum(inter_w, 0, out=inter_w)
+    
+    inter = np.minimum(t[:, None, 3], d[None, :, 3])
+    np.subtract(inter, np.maximum(t[:, None, 1], d[None, :, 1]), out=inter)
+    np.maximum(inter, 0, out=inter)
+    np.multiply(inter, inter_w, out=inter)
     
-    def predict(self) -> np.ndarray:
-        self.x = self.F @ self.x
-        self.P = self.F @ self.P @ self.F.T + self.Q
-        return self.x[:4]
+    area_t = (t[:, 2] - t[:, 0]) * (t[:, 3] - t[:, 1])
+    area_d = (d[:, 2] - d[:, 0]) * (d[:, 3] - d[:, 1])
     
-    def update(self, bbox: List[float]):
-        cx = (bbox[0] + bbox[2]) / 2
-        cy = (bbox[1] + bbox[3]) / 2
-        w = bbox[2] - bbox[0]
-        h = bbox[3] - bbox[1]
+    # union ditulis ke inter_w (sudah tidak dipakai)
+    np.add(area_t[:, None], area_d[None, :], out=inter_w)
+    np.subtract(inter_w, inter, out=inter_w)
+    np.maximum(inter_w, 1e-6, out=inter_w)
+    return np.divide(inter, inter_w, out=inter)
+
+
+def _center_dist_matrix(tracks_xyxy: np.ndarray, dets_xyxy: np.ndarray) -> np.ndarray:
+    """Jarak titik tengah berpasangan (N, M) antara bbox track dan deteksi"""
+    ct = (tracks_xyxy[:, :2] + tracks_xyxy[:, 2:]) * 0.5
+    cd = (dets_xyxy[:, :2] + dets_xyxy[:, 2:]) * 0.5
+    return np.hypot(ct[:, None, 0] - cd[None, :, 0], ct[:, None, 1] - cd[None, :, 1])
+
+
+if HAS_NUMBA:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def build_cost(preds, dets, tg, dg, ctr_thresh, out):
+        """Cost matrix fused (IoU + jarak center + mask tipe) langsung ke out (JIT)"""
+        n = preds.shape[0]
+        m = dets.shape[0]
+        for i in prange(n):
+            tx1, ty1, tx2, ty2 = preds[i, 0], preds[i, 1], preds[i, 2], preds[i, 3]
+            area_t = (tx2 - tx1) * (ty2 - ty1)
+            tcx = (tx1 + tx2) * 0.5
+            tcy = (ty1 + ty2) * 0.5
+            for j in range(m):
+                if tg[i] != dg[j]:
+                    out[i, j] = 1.0
+                    continue
+                dx1, dy1, dx2, dy2 = dets[j, 0], dets[j, 1], dets[j, 2], dets[j, 3]
+                iw = max(min(tx2, dx2) - max(tx1, dx1), 0.0)
+                ih = max(min(ty2, dy2) - max(ty1, dy1), 0.0)
+                inter = iw * ih
+                union = max(area_t + (dx2 - dx1) * (dy2 - dy1) - inter, 1e-6)
+                iou = inter / union
+                
+                ddx = tcx - (dx1 + dx2) * 0.5
+                ddy = tcy - (dy1 + dy2) * 0.5
+                dist = min(np.sqrt(ddx * ddx + ddy * ddy) / ctr_thresh, 1.0)
+                
+                if iou > 0.1:
+                    out[i, j] = 0.6 * (1.0 - iou) + 0.4 * dist
+                else:
+                    out[i, j] = 0.3 * (1.0 - iou) + 0.7 * dist
+else:
+    def build_cost(preds: np.ndarray, dets: np.ndarray, tg: np.ndarray, dg: np.ndarray,
+                   ctr_thresh: float, out: np.ndarray):
+        """
+        Cost matrix hybrid IoU + jarak center, ditulis ke out.
+        
+        Args:
+            preds: Bbox prediksi track (N, 4)
+            dets: Bbox deteksi (M, 4)
+            tg: Id grup tipe track (N,)
+            dg: Id grup tipe deteksi (M,)
+            ctr_thresh: Jarak center (pixel) yang dinormalisasi ke cost 1.0
+            out: Array output (N, M)
+        """
+        iou = _iou_matrix(preds, dets)
+        dist_cost = _center_dist_matrix(preds, dets)
+        np.divide(dist_cost, ctr_thresh, out=dist_cost)
+        np.minimum(dist_cost, 1.0, out=dist_cost)
         
-        z = np.array([cx, cy, w * h, w / max(h, 1)])
-        S = self.H @ self.P @ self.H.T + self.R
-        K = self.P @ self.H.T @ np.linalg.inv(S)
+        # Prefer IoU kalau overlap, kalau tidak pakai jarak
+        iou_cost = 1.0 - iou
+        np.copyto(out, np.where(iou > 0.1,
+                                0.6 * iou_cost + 0.4 * dist_cost,
+                                0.3 * iou_cost + 0.7 * dist_cost))
         
-        self.x = self.x + K @ (z - self.H @ self.x)
-        self.P = (np.eye(8) - K @ self.H) @ self.P
+        # Kompatibilitas tipe: grup sama (tipe identik otomatis grup sama)
+        out[tg[:, None] != dg[None, :]] = 1.0
+
+
+# ============================================
+# KALMAN FILTER (BATCHED, SoA)
+# ============================================
+# State per track: [cx, cy, area, aspect, vcx, vcy, varea, vaspect].
+# Semua track disimpan sebagai satu array (N, 8) + (N, 8, 8) di ByteTracker,
+# jadi predict/update jalan sekali per frame untuk semua track.
+#
+# Model konstan: F = I + shift (posisi += kecepatan untuk cx, cy, area) dan
+# H = [I | 0], jadi kernel di bawah ditulis langsung tanpa matmul F/H:
+#   F @ x          -> x[:3] += x[4:7]
+#   F @ P @ F.T    -> baris 0..2 += baris 4..6, lalu kolom 0..2 += kolom 4..6
+#   H @ P @ H.T    -> P[:4, :4],  P @ H.T -> P[:, :4],  H @ x -> x[:4]
+
+_KF_Q = np.eye(8) * 0.1
+_KF_R = np.eye(4) * 1.0
+_KF_P0 = np.eye(8) * 10
+
+
+def _bbox_to_z(bboxes: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Konversi bbox (K, 4) xyxy ke measurement (K, 4) [cx, cy, area, aspect].
+    
+    out boleh sama dengan bboxes (konversi in-place, tanpa alokasi array K x 4 baru).
+    """
+    if out is None:
+        out = np.empty_like(bboxes)
+    w = bboxes[:, 2] - bboxes[:, 0]
+    h = bboxes[:, 3] - bboxes[:, 1]
+    out[:, 0] = (bboxes[:, 0] + bboxes[:, 2]) * 0.5
+    out[:, 1] = (bboxes[:, 1] + bboxes[:, 3]) * 0.5
+    out[:, 2] = w * h
+    np.maximum(h, 1, out=h)
+    np.divide(w, h, out=out[:, 3])
+    return out
+
+
+def _state_to_bbox(X: np.ndarray) -> np.ndarray:
+    """Konversi state (N, 8) ke bbox (N, 4) xyxy"""
+    cx, cy, area, ar = X[:, 0], X[:, 1], X[:, 2], X[:, 3]
+    w = np.sqrt(np.maximum(area * ar, 1))
+    h = np.maximum(area / w, 1)
+    return np.column_stack((cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2))
+
+
+if HAS_NUMBA:
+    @njit(cache=True, fastmath=True)
+    def kf_predict(X, P, Q):
+        """Predict in-place untuk semua track (JIT)"""
+        n, d = X.shape
+        for k in range(n):
+            for i in range(3):
+                X[k, i] += X[k, i + 4]
+            for i in range(3):
+                for j in range(d):
+                    P[k, i, j] += P[k, i + 4, j]
+            for i in range(d):
+                for j in range(3):
+                    P[k, i, j] += P[k, i, j + 4]
+            for i in range(d):
+                for j in range(d):
+                    P[k, i, j] += Q[i, j]
+    
+    @njit(cache=True, fastmath=True)
+    def kf_update(X, P, idx, z, R):
+        """Update in-place untuk baris idx (JIT)"""
+        for r in range(idx.shape[0]):
+            k = idx[r]
+            Pk = P[k]
+            PHt = np.ascontiguousarray(Pk[:, :4])
+            HP = np.ascontiguousarray(Pk[:4, :])
+            S = HP[:, :4] + R
+            # solve, bukan inv(S): K tidak pernah dibentuk
+            y = z[r] - X[k, :4]
+            X[k] = X[k] + PHt @ np.linalg.solve(S, y)
+            P[k] = Pk - PHt @ np.linalg.solve(S, HP)
+else:
+    def kf_predict(X: np.ndarray, P: np.ndarray, Q: np.ndarray):
+        """Predict in-place untuk semua track (batched)"""
+        X[:, :3] += X[:, 4:7]
+        P[:, :3, :] += P[:, 4:7, :]
+        P[:, :, :3] += P[:, :, 4:7]
+        P += Q
     
-    def get_bbox(self) -> List[float]:
-        cx, cy, area, ar = self.x[:4]
-        w = np.sqrt(max(area * ar, 1))
-        h = max(area / w, 1)
-        return [cx - w/2, cy - h/2, cx + w/2, cy + h/2]
+    def kf_update(X: np.ndarray, P: np.ndarray, idx: np.ndarray, z: np.ndarray,
+                  R: np.ndarray):
+        """
+        Update in-place untuk track yang ter-match.
+        
+        Args:
+            X: State (N, 8)
+            P: Kovarians (N, 8, 8)
+            idx: Index baris track yang ter-match (K,)
+            z: Measurement (K, 4)
+            R: Noise measurement (4, 4)
+        """
+        Xm, Pm = X[idx], P[idx]
+        PHt = Pm[:, :, :4]
+        HP = Pm[:, :4, :]
+        S = Pm[:, :4, :4] + R
+        
+        # solve, bukan inv(S): K tidak pernah dibentuk
+        y = z - Xm[:, :4]
+        X[idx] = Xm + (PHt @ np.linalg.solve(S, y[:, :, None]))[:, :, 0]
+        P[idx] = Pm - PHt @ np.linalg.solve(S, HP)
 
 
 @dataclass
 class STrack:
-    """Single track object"""
+    """Single track object (state Kalman ada di ByteTracker, baris sejajar self.tracks)"""
     track_id: int
     bbox: List[float]
     damage_type: str
@@ -81,29 +263,16 @@ class STrack:
     age: int = 0
     first_location: Tuple[float, float] = (0.0, 0.0)
     last_location: Tuple[float, float] = (0.0, 0.0)
-    kalman: KalmanFilter = field(default_factory=KalmanFilter)
     is_saved: bool = False
     
-    def __post_init__(self):
-        self.kalman = KalmanFilter()
-        self.kalman.init(self.bbox)
-    
-    def predict(self):
-        self.kalman.predict()
-        self.age += 1
-    
     def update(self, det: dict, frame_id: int, location: Tuple[float, float]):
         self.bbox = det['bbox']
-        self.kalman.update(det['bbox'])
         self.confidence = max(self.confidence, det['conf'])
         self.damage_type = det['type']  # Update type
         self.frame_id = frame_id
         self.last_location = location
         self.hits += 1
         self.age = 0
-    
-    def get_predicted_bbox(self) -> List[float]:
-        return self.kalman.get_bbox()
 
 
 class ByteTracker:
@@ -123,6 +292,10 @@ class ByteTracker:
         'alligator': ['D20', 'Alligator', 'Alligator Crack'],
     }
     
+    # Lookup terbalik tipe -> grup / id grup (dibangun sekali)
+    _TYPE_TO_GROUP = {t: g for g, types in TYPE_GROUPS.items() for t in types}
+    _TYPE_TO_GROUP_ID = {t: i for i, types in enumerate(TYPE_GROUPS.values()) for t in types}
+    
     def __init__(self,
                  high_thresh: float = 0.3,       # LOWERED from 0.5
                  low_thresh: float = 0.1,
@@ -130,7 +303,8 @@ class ByteTracker:
                  center_thresh: float = 100,     # Center distance threshold (pixels)
                  max_age: int = 30,
                  min_hits: int = 1,
-                 min_distance_meters: float = 10.0):
+                 min_distance_meters: float = 10.0,
+                 verbose: bool = False):
         
         self.high_thresh = high_thresh
         self.low_thresh = low_thresh
@@ -139,31 +313,53 @@ class ByteTracker:
         self.max_age = max_age
         self.min_hits = min_hits
         self.min_distance_meters = min_distance_meters
+        # Log per-frame ([BYTE]/[MATCH]/[NEW]/[SKIP]) hanya kalau verbose,
+        # f-string-nya juga tidak diformat saat mati
+        self.verbose = verbose
         
         self.tracks: List[STrack] = []
+        # State Kalman batched, baris ke-i milik self.tracks[i]
+        self._kf_x = np.zeros((0, 8))
+        self._kf_P = np.zeros((0, 8, 8))
         self.next_id = 0
         self.frame_id = 0
         
         self.total_damages = 0
         self.damage_counts = defaultdict(int)
         self.recorded_locations: List[Tuple[float, float, str, int]] = []
+        self._reset_location_index()
         self.enable_spatial_dedup = True
         
         # Frame size for normalization
         self.frame_diagonal = 2000
+        
+        # Id grup untuk tipe di luar TYPE_GROUPS, dialokasikan saat pertama muncul
+        self._group_ids: Dict[str, int] = dict(self._TYPE_TO_GROUP_ID)
+        self._group_name_ids: Dict[str, int] = {g: i for i, g in enumerate(self.TYPE_GROUPS)}
     
     def set_frame_size(self, width: int, height: int):
         self.frame_diagonal = np.sqrt(width**2 + height**2)
         self.center_thresh = self.frame_diagonal * 0.08  # 8% of diagonal
     
     def get_type_group(self, dtype: str) -> str:
-        for group, types in self.TYPE_GROUPS.items():
-            if dtype in types:
-                return group
-        return dtype.lower()
+        group = self._TYPE_TO_GROUP.get(dtype)
+        return group if group is not None else dtype.lower()
+    
+    def get_type_group_id(self, dtype: str) -> int:
+        """Id integer dari grup tipe, konsisten dengan get_type_group"""
+        gid = self._group_ids.get(dtype)
+        if gid is None:
+            names = self._group_name_ids
+            gid = names.setdefault(self.get_type_group(dtype), len(names))
+            self._group_ids[dtype] = gid
+        return gid
+    
+    def _group_id_array(self, types) -> np.ndarray:
+        return np.fromiter((self.get_type_group_id(t) for t in types),
+                           dtype=np.int32, count=len(types))
     
     def is_type_compatible(self, t1: str, t2: str) -> bool:
-        return t1 == t2 or self.get_type_group(t1) == self.get_type_group(t2)
+        return t1 == t2 or self.get_type_group_id(t1) == self.get_type_group_id(t2)
     
     def calculate_iou(self, box1: List[float], box2: List[float]) -> float:
         x1 = max(box1[0], box2[0])
@@ -182,64 +378,118 @@ class ByteTracker:
         c2 = ((box2[0] + box2[2]) / 2, (box2[1] + box2[3]) / 2)
         return np.sqrt((c1[0] - c2[0])**2 + (c1[1] - c2[1])**2)
     
-    def calculate_cost(self, track: STrack, det: dict) -> float:
-        """
-        Calculate matching cost (lower = better match).
-        Uses hybrid of IoU and center distance.
+    def build_cost_matrix(self, tracks: List[STrack], dets: List[dict],
+                          pred_bboxes: Optional[np.ndarray] = None,
+                          det_bboxes: Optional[np.ndarray] = None) -> np.ndarray:
         """
-        if not self.is_type_compatible(track.damage_type, det['type']):
-            return 1.0  # Max cost
+        Cost matrix (N, M): hybrid IoU + jarak center (lower = better match).
         
-        pred_bbox = track.get_predicted_bbox()
-        
-        iou = self.calculate_iou(pred_bbox, det['bbox'])
-        center_dist = self.calculate_center_dist(pred_bbox, det['bbox'])
-        
-        # IoU cost (0 = perfect match, 1 = no overlap)
-        iou_cost = 1.0 - iou
-        
-        # Distance cost (normalized)
-        dist_cost = min(center_dist / self.center_thresh, 1.0)
-        
-        # Combined cost: prefer IoU if there's overlap, otherwise use distance
-        if iou > 0.1:
-            cost = 0.6 * iou_cost + 0.4 * dist_cost
-        else:
-            cost = 0.3 * iou_cost + 0.7 * dist_cost
+        Args:
+            tracks: List track aktif (sudah di-predict)
+            dets: List deteksi frame ini
+            pred_bboxes: Bbox prediksi (N, 4), default bbox terakhir tiap track
+            det_bboxes: Bbox deteksi (M, 4), default dari dets
+            
+        Returns:
+            Array (N, M) cost, 1.0 untuk pasangan tipe yang tidak kompatibel
+        """
+        pred = pred_bboxes
+        if pred is None:
+            pred = np.array([t.bbox for t in tracks], dtype=np.float64)
+        boxes = det_bboxes
+        if boxes is None:
+            boxes = np.array([d['bbox'] for d in dets], dtype=np.float64)
+        track_groups = self._group_id_array([t.damage_type for t in tracks])
+        det_groups = self._group_id_array([d['type'] for d in dets])
+        
+        cost = np.empty((len(tracks), len(dets)))
+        build_cost(pred, boxes, track_groups, det_groups, float(self.center_thresh), cost)
         
         return cost
     
-    def match_detections(self, tracks: List[STrack], dets: List[dict], thresh: float):
-        """Match detections to tracks using Hungarian or greedy algorithm"""
-        if len(tracks) == 0 or len(dets) == 0:
-            return [], list(range(len(tracks))), list(range(len(dets)))
+    def _solve_assignment(self, cost_matrix: np.ndarray, thresh: float) -> List[Tuple[int, int]]:
+        """Selesaikan assignment pada cost matrix, hanya pasangan dengan cost <= thresh"""
+        if cost_matrix.size == 0:
+            return []
         
-        # Build cost matrix
-        cost_matrix = np.zeros((len(tracks), len(dets)))
-        for t_idx, track in enumerate(tracks):
-            for d_idx, det in enumerate(dets):
-                cost_matrix[t_idx, d_idx] = self.calculate_cost(track, det)
+        # Kalau mayoritas pasangan sudah lewat gate (sparse), LAPJV dengan
+        # cost_limit melewati edge yang mustahil sama sekali.
+        feasible_ratio = np.count_nonzero(cost_matrix <= thresh) / cost_matrix.size
+        if HAS_LAP and feasible_ratio < 0.3:
+            _, x, _ = lap.lapjv(cost_matrix, extend_cost=True, cost_limit=thresh)
+            return [(r, c) for r, c in enumerate(x.tolist()) if c >= 0]
         
-        # Solve assignment
         if HAS_SCIPY:
             row_ind, col_ind = linear_sum_assignment(cost_matrix)
-            matched = [(r, c) for r, c in zip(row_ind, col_ind) if cost_matrix[r, c] <= thresh]
-        else:
-            # Greedy fallback
-            matched = []
-            flat = [(cost_matrix[i, j], i, j) for i in range(len(tracks)) for j in range(len(dets))]
-            flat.sort()
-            used_tracks, used_dets = set(), set()
-            for cost, t_idx, d_idx in flat:
-                if cost > thresh:
-                    break
-                if t_idx not in used_tracks and d_idx not in used_dets:
-                    matched.append((t_idx, d_idx))
-                    used_tracks.add(t_idx)
-                    used_dets.add(d_idx)
-        
-        unmatched_tracks = [i for i in range(len(tracks)) if i not in [m[0] for m in matched]]
-        unmatched_dets = [i for i in range(len(dets)) if i not in [m[1] for m in matched]]
+            return [(r, c) for r, c in zip(row_ind.tolist(), col_ind.tolist())
+                    if cost_matrix[r, c] <= thresh]
+        
+        # Greedy fallback
+        matched = []
+        n_rows, n_cols = cost_matrix.shape
+        flat = [(cost_matrix[i, j], i, j) for i in range(n_rows) for j in range(n_cols)]
+        flat.sort()
+        used_tracks, used_dets = set(), set()
+        for cost, t_idx, d_idx in flat:
+            if cost > thresh:
+                break
+            if t_idx not in used_tracks and d_idx not in used_dets:
+                matched.append((t_idx, d_idx))
+                used_tracks.add(t_idx)
+                used_dets.add(d_idx)
+        return matched
+    
+    def match_detections(self, tracks: List[STrack], dets: List[dict], thresh: float,
+                         pred_bboxes: Optional[np.ndarray] = None,
+                         det_bboxes: Optional[np.ndarray] = None):
+        """
+        Match detections to tracks.
+        
+        Pasangan "mudah" (IoU > 0.7, tipe kompatibel) dikunci dulu secara greedy,
+        sisanya baru diselesaikan dengan Hungarian/LAPJV/greedy.
+        """
+        if len(tracks) == 0 or len(dets) == 0:
+            return [], list(range(len(tracks))), list(range(len(dets)))
+        
+        if pred_bboxes is None:
+            pred_bboxes = np.array([t.bbox for t in tracks], dtype=np.float64)
+        if det_bboxes is None:
+            det_bboxes = np.array([d['bbox'] for d in dets], dtype=np.float64)
+        cost_matrix = self.build_cost_matrix(tracks, dets, pred_bboxes, det_bboxes)
+        
+        # ========== STAGE 1: GREEDY HIGH-IoU ==========
+        matched = []
+        iou = _iou_matrix(pred_bboxes, det_bboxes)
+        iou[cost_matrix > thresh] = 0.0  # tipe tidak kompatibel / tidak lolos gate
+        n_dets = len(dets)
+        while True:
+            k = int(iou.argmax())
+            r, c = divmod(k, n_dets)
+            if iou[r, c] <= 0.7:
+                break
+            matched.append((r, c))
+            iou[r, :] = 0.0
+            iou[:, c] = 0.0
+        
+        # ========== STAGE 2: SOLVE RESIDUAL ==========
+        row_free = np.ones(len(tracks), dtype=bool)
+        col_free = np.ones(n_dets, dtype=bool)
+        for r, c in matched:
+            row_free[r] = False
+            col_free[c] = False
+        rows = np.flatnonzero(row_free)
+        cols = np.flatnonzero(col_free)
+        
+        if len(rows) and len(cols):
+            sub = cost_matrix[np.ix_(rows, cols)]
+            for r, c in self._solve_assignment(sub, thresh):
+                r, c = int(rows[r]), int(cols[c])
+                matched.append((r, c))
+                row_free[r] = False
+                col_free[c] = False
+        
+        unmatched_tracks = np.flatnonzero(row_free).tolist()
+        unmatched_dets = np.flatnonzero(col_free).tolist()
         
         return matched, unmatched_tracks, unmatched_dets
     
@@ -249,15 +499,85 @@ class ByteTracker:
         a = sin((lat2-lat1)/2)**2 + cos(lat1) * cos(lat2) * sin((lon2-lon1)/2)**2
         return R * 2 * asin(sqrt(a))
     
+    # ========== SPATIAL INDEX (DEDUP LOKASI) ==========
+    # Lokasi diproyeksikan equirectangular ke meter untuk cKDTree; kandidat
+    # dari tree (radius sedikit dilebarkan) dicek ulang dengan haversine
+    # vektor. Insert terbaru menunggu di tail dan digabung ke array tiap
+    # _KDTREE_REBUILD insert (amortized), sekaligus rebuild tree.
+    
+    _KDTREE_REBUILD = 32
+    _METERS_PER_DEG = 111320.0
+    
+    def _reset_location_index(self):
+        self._lat0_cos: Optional[float] = None
+        self._rec_xy = np.empty((0, 2))
+        self._rec_ll = np.empty((0, 2))  # (lat, lon) dalam radian
+        self._rec_groups = np.empty(0, dtype=np.int32)
+        self._rec_ids = np.empty(0, dtype=np.int64)
+        self._rec_tree = None
+        self._rec_pending: List[Tuple[float, float, float, float, int, int]] = []
+    
+    def _project(self, lat: float, lon: float) -> Tuple[float, float]:
+        if self._lat0_cos is None:
+            self._lat0_cos = cos(radians(lat))
+        return (lon * self._lat0_cos * self._METERS_PER_DEG,
+                lat * self._METERS_PER_DEG)
+    
+    def _record_location(self, lat: float, lon: float, dtype: str, track_id: int):
+        """Catat lokasi damage ke recorded_locations + spatial index"""
+        self.recorded_locations.append((lat, lon, self.get_type_group(dtype), track_id))
+        x, y = self._project(lat, lon)
+        self._rec_pending.append((x, y, radians(lat), radians(lon),
+                                  self.get_type_group_id(dtype), track_id))
+        
+        if len(self._rec_pending) >= self._KDTREE_REBUILD:
+            pending = np.array(self._rec_pending)
+            self._rec_xy = np.concatenate((self._rec_xy, pending[:, 0:2]))
+            self._rec_ll = np.concatenate((self._rec_ll, pending[:, 2:4]))
+            self._rec_groups = np.concatenate((self._rec_groups, pending[:, 4].astype(np.int32)))
+            self._rec_ids = np.concatenate((self._rec_ids, pending[:, 5].astype(np.int64)))
+            if HAS_KDTREE:
+                self._rec_tree = cKDTree(self._rec_xy)
+            self._rec_pending.clear()
+    
+    def _any_within(self, lat_r: float, lon_r: float, ll: np.ndarray, groups: np.ndarray,
+                    ids: np.ndarray, group_id: int, track_id: int) -> bool:
+        """Haversine vektor: apakah ada lokasi segrup (selain track_id) dalam min_distance"""
+        mask = (groups == group_id) & (ids != track_id)
+        if not mask.any():
+            return False
+        ll = ll[mask]
+        dlat = ll[:, 0] - lat_r
+        dlon = ll[:, 1] - lon_r
+        a = np.sin(dlat / 2) ** 2 + cos(lat_r) * np.cos(ll[:, 0]) * np.sin(dlon / 2) ** 2
+        d = 6371000 * 2 * np.arcsin(np.sqrt(a))
+        return bool((d < self.min_distance_meters).any())
+    
     def is_location_recorded(self, lat: float, lon: float, dtype: str, track_id: int) -> bool:
         if not self.enable_spatial_dedup or (lat == 0 and lon == 0):
             return False
+        if not self.recorded_locations:
+            return False
+        
+        group_id = self.get_type_group_id(dtype)
+        lat_r, lon_r = radians(lat), radians(lon)
+        
+        if len(self._rec_ids):
+            if self._rec_tree is not None:
+                # Radius dilebarkan untuk menutup error proyeksi, dicek ulang haversine
+                idx = self._rec_tree.query_ball_point(self._project(lat, lon),
+                                                      r=self.min_distance_meters * 1.05 + 0.5)
+                idx = np.asarray(idx, dtype=np.intp)
+            else:
+                idx = slice(None)
+            if self._any_within(lat_r, lon_r, self._rec_ll[idx], self._rec_groups[idx],
+                                self._rec_ids[idx], group_id, track_id):
+                return True
         
-        type_group = self.get_type_group(dtype)
-        for rec_lat, rec_lon, rec_group, rec_id in self.recorded_locations:
-            if rec_id == track_id or rec_group != type_group:
-                continue
-            if self.haversine(lat, lon, rec_lat, rec_lon) < self.min_distance_meters:
+        if self._rec_pending:
+            pending = np.array(self._rec_pending)
+            if self._any_within(lat_r, lon_r, pending[:, 2:4], pending[:, 4].astype(np.int32),
+                                pending[:, 5].astype(np.int64), group_id, track_id):
                 return True
         return False
     
@@ -270,7 +590,7 @@ class ByteTracker:
             # Age all tracks
             for track in self.tracks:
                 track.age += 1
-            self.tracks = [t for t in self.tracks if t.age <= self.max_age]
+            self._prune_tracks()
             return []
         
         # Split by confidence
@@ -278,26 +598,45 @@ class ByteTracker:
         low_dets = [d for d in detections if self.low_thresh <= d.get('conf', 0.5) < self.high_thresh]
         all_dets = high_dets + low_dets  # Consider ALL detections
         
-        print(f"\n[BYTE] Frame {self.frame_id}: {len(all_dets)} dets ({len(high_dets)} high, {len(low_dets)} low), {len(self.tracks)} tracks")
+        if self.verbose:
+            print(f"\n[BYTE] Frame {self.frame_id}: {len(all_dets)} dets ({len(high_dets)} high, {len(low_dets)} low), {len(self.tracks)} tracks")
         
-        # Predict all tracks
+        # Predict all tracks (batched), bbox prediksi dihitung sekali per frame
         for track in self.tracks:
-            track.predict()
+            track.age += 1
+        kf_predict(self._kf_x, self._kf_P, _KF_Q)
+        pred_bboxes = _state_to_bbox(self._kf_x)
         
         # ========== MATCH ALL DETECTIONS ==========
         # Use lower threshold for matching
+        det_bboxes = np.array([d['bbox'] for d in all_dets], dtype=np.float64).reshape(-1, 4)
         matched, unmatched_tracks, unmatched_dets = self.match_detections(
-            self.tracks, all_dets, thresh=0.7  # Allow up to 0.7 cost
+            self.tracks, all_dets, thresh=0.7,  # Allow up to 0.7 cost
+            pred_bboxes=pred_bboxes, det_bboxes=det_bboxes
         )
+        # Setelah matching, array bbox deteksi dipakai ulang sebagai measurement z
+        det_z = _bbox_to_z(det_bboxes, out=det_bboxes)
         
         # Update matched tracks
         for t_idx, d_idx in matched:
             track = self.tracks[t_idx]
             det = all_dets[d_idx]
             track.update(det, self.frame_id, location)
-            print(f"  [MATCH] Det({det['type']}, {det.get('conf', 0):.2f}) -> Track#{track.track_id} (hits:{track.hits})")
+            if self.verbose:
+                print(f"  [MATCH] Det({det['type']}, {det.get('conf', 0):.2f}) -> Track#{track.track_id} (hits:{track.hits})")
+        
+        if matched:
+            t_idx = np.fromiter((m[0] for m in matched), dtype=np.intp, count=len(matched))
+            z = det_z[np.fromiter((m[1] for m in matched), dtype=np.intp, count=len(matched))]
+            kf_update(self._kf_x, self._kf_P, t_idx, z, _KF_R)
         
         # ========== CREATE NEW TRACKS FOR ALL UNMATCHED ==========
+        if unmatched_dets:
+            new_x = np.zeros((len(unmatched_dets), 8))
+            new_x[:, :4] = det_z[unmatched_dets]
+            self._kf_x = np.concatenate((self._kf_x, new_x))
+            self._kf_P = np.concatenate((self._kf_P, np.broadcast_to(_KF_P0, (len(unmatched_dets), 8, 8))))
+        
         for d_idx in unmatched_dets:
             det = all_dets[d_idx]
             
@@ -322,7 +661,7 @@ class ByteTracker:
             
             lat, lon = location
             if not self.is_location_recorded(lat, lon, det['type'], new_track.track_id):
-                self.recorded_locations.append((lat, lon, self.get_type_group(det['type']), new_track.track_id))
+                self._record_location(lat, lon, det['type'], new_track.track_id)
                 
                 new_damages.append({
                     'track_id': new_track.track_id,
@@ -333,20 +672,73 @@ class ByteTracker:
                     'lon': lon,
                     'first_seen_frame': self.frame_id
                 })
-                print(f"  [NEW] Track#{new_track.track_id} ({det['type']}, {det.get('conf', 0):.2f}) -> SAVED")
-            else:
+                if self.verbose:
+                    print(f"  [NEW] Track#{new_track.track_id} ({det['type']}, {det.get('conf', 0):.2f}) -> SAVED")
+            elif self.verbose:
                 print(f"  [SKIP] Track#{new_track.track_id} ({det['type']}) -> Duplicate location")
             
             self.next_id += 1
         
         # ========== REMOVE OLD TRACKS ==========
-        self.tracks = [t for t in self.tracks if t.age <= self.max_age]
+        self._prune_tracks()
         
         if new_damages:
-            print(f"[BYTE] Total NEW: {len(new_damages)}")
+            if self.verbose:
+                print(f"[BYTE] Total NEW: {len(new_damages)}")
         
         return new_damages
     
+    def _prune_tracks(self):
+        """Buang track yang sudah melewati max_age beserta baris state Kalman-nya"""
+        keep = np.fromiter((t.age <= self.max_age for t in self.tracks),
+                           dtype=bool, count=len(self.tracks))
+        if keep.all():
+            return
+        self.tracks = [t for t, k in zip(self.tracks, keep) if k]
+        self._kf_x = self._kf_x[keep]
+        self._kf_P = self._kf_P[keep]
+    
+    def process_window(self, detections_list: List[List[dict]],
+                       locations: List[Tuple[float, float]], start_frame: int = 0) -> List[dict]:
+        """
+        Jalankan tracking untuk satu window frame dan kembalikan semua tracklet.
+        
+        Spatial dedup dimatikan di sini; dilakukan sekali setelah stitching
+        (lihat track_offline).
+        
+        Args:
+            detections_list: Deteksi per frame dalam window
+            locations: (lat, lon) per frame dalam window
+            start_frame: Nomor frame global sebelum frame pertama window
+            
+        Returns:
+            List tracklet dict: track_id, type, conf, first_frame, last_frame,
+            first_bbox, last_bbox, lat, lon
+        """
+        self.reset()
+        self.enable_spatial_dedup = False
+        self.frame_id = start_frame
+        
+        tracklets: Dict[int, dict] = {}
+        for dets, loc in zip(detections_list, locations):
+            self.update(dets, loc)
+            for t in self.tracks:
+                if t.frame_id != self.frame_id:
+                    continue  # tidak di-update frame ini
+                tl = tracklets.get(t.track_id)
+                if tl is None:
+                    tracklets[t.track_id] = {
+                        'track_id': t.track_id, 'type': t.damage_type, 'conf': t.confidence,
+                        'first_frame': t.frame_id, 'last_frame': t.frame_id,
+                        'first_bbox': list(t.bbox), 'last_bbox': list(t.bbox),
+                        'lat': t.first_location[0], 'lon': t.first_location[1],
+                    }
+                else:
+                    tl['last_frame'] = t.frame_id
+                    tl['last_bbox'] = list(t.bbox)
+                    tl['conf'] = t.confidence
+        return list(tracklets.values())
+    
     def get_statistics(self) -> dict:
         return {
             'total_damages': self.total_damages,
@@ -357,11 +749,119 @@ class ByteTracker:
     
     def reset(self):
         self.tracks.clear()
+        self._kf_x = np.zeros((0, 8))
+        self._kf_P = np.zeros((0, 8, 8))
         self.next_id = 0
         self.frame_id = 0
         self.total_damages = 0
         self.damage_counts.clear()
         self.recorded_locations.clear()
+        self._reset_location_index()
+
+
+# ============================================
+# OFFLINE TRACKING (WINDOW PARALEL + STITCHING)
+# ============================================
+
+def _track_window(tracker_kwargs: dict, detections_list: List[List[dict]],
+                  locations: List[Tuple[float, float]], start_frame: int) -> List[dict]:
+    """Worker: tracker baru per window (state tidak dibagi antar proses)"""
+    return ByteTracker(**tracker_kwargs).process_window(detections_list, locations, start_frame)
+
+
+def track_offline(detections_per_frame: List[List[dict]],
+                  locations: List[Tuple[float, float]],
+                  window: int = 500,
+                  n_jobs: int = 4,
+                  **tracker_kwargs) -> List[dict]:
+    """
+    Tracking offline untuk video yang deteksinya sudah lengkap.
+    
+    Video dipotong jadi window frame yang diproses paralel (joblib jika ada),
+    tracklet di batas window disambung berdasarkan IoU + grup tipe, ID
+    dinomori ulang secara global, lalu spatial dedup dijalankan sekali.
+    
+    Args:
+        detections_per_frame: Deteksi per frame (format sama dengan update)
+        locations: (lat, lon) per frame
+        window: Jumlah frame per window
+        n_jobs: Jumlah worker paralel
+        **tracker_kwargs: Argumen untuk ByteTracker
+        
+    Returns:
+        List damage unik (format sama dengan hasil update)
+    """
+    n = len(detections_per_frame)
+    starts = list(range(0, n, window))
+    jobs = [(tracker_kwargs, detections_per_frame[s:s + window], locations[s:s + window], s)
+            for s in starts]
+    if HAS_JOBLIB and n_jobs != 1 and len(jobs) > 1:
+        results = Parallel(n_jobs=n_jobs)(delayed(_track_window)(*job) for job in jobs)
+    else:
+        results = [_track_window(*job) for job in jobs]
+    
+    tracker = ByteTracker(**tracker_kwargs)
+    max_age = tracker.max_age
+    
+    # ========== STITCHING ANTAR WINDOW ==========
+    # Key tracklet: (index window, track_id lokal); parent -> tracklet induknya
+    parent: Dict[Tuple[int, int], Tuple[int, int]] = {}
+    merged: Dict[Tuple[int, int], dict] = {}
+    for w, tracklets in enumerate(results):
+        for tl in tracklets:
+            merged[(w, tl['track_id'])] = dict(tl)
+    
+    def root(key):
+        while key in parent:
+            key = parent[key]
+        return key
+    
+    for w in range(len(results) - 1):
+        end = starts[w] + window
+        tail = [tl for tl in results[w] if tl['last_frame'] > end - max_age]
+        head = [tl for tl in results[w + 1] if tl['first_frame'] <= end + max_age]
+        if not tail or not head:
+            continue
+        
+        iou = _iou_matrix(np.array([t['last_bbox'] for t in tail], dtype=np.float64),
+                          np.array([h['first_bbox'] for h in head], dtype=np.float64))
+        tg = tracker._group_id_array([t['type'] for t in tail])
+        hg = tracker._group_id_array([h['type'] for h in head])
+        iou[tg[:, None] != hg[None, :]] = 0.0
+        
+        while True:
+            k = int(iou.argmax())
+            r, c = divmod(k, len(head))
+            if iou[r, c] < tracker.match_thresh:
+                break
+            iou[r, :] = 0.0
+            iou[:, c] = 0.0
+            
+            src = root((w, tail[r]['track_id']))
+            dst = (w + 1, head[c]['track_id'])
+            parent[dst] = src
+            a, b = merged[src], merged.pop(dst)
+            a['last_frame'] = b['last_frame']
+            a['last_bbox'] = b['last_bbox']
+            a['conf'] = max(a['conf'], b['conf'])
+    
+    # ========== RENUMBER + SPATIAL DEDUP ==========
+    new_damages = []
+    for new_id, tl in enumerate(sorted(merged.values(), key=lambda t: t['first_frame'])):
+        lat, lon = tl['lat'], tl['lon']
+        if tracker.is_location_recorded(lat, lon, tl['type'], new_id):
+            continue
+        tracker._record_location(lat, lon, tl['type'], new_id)
+        new_damages.append({
+            'track_id': new_id,
+            'bbox': tl['first_bbox'],
+            'type': tl['type'],
+            'conf': tl['conf'],
+            'lat': lat,
+            'lon': lon,
+            'first_seen_frame': tl['first_frame'],
+        })
+    return new_damages
 
 
 # Aliases
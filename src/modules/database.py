@@ -13,8 +13,54 @@ from datetime import datetime
 from typing import List, Dict, Optional, Tuple
 from dataclasses import dataclass, asdict
 from contextlib import contextmanager
+from functools import lru_cache
+import atexit
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import time
 
+# Base64 backend dipilih sekali saat import: pybase64 (SIMD) jika tersedia.
+# Dipakai juga oleh components.map_view agar backend selalu sama.
+try:
+    import pybase64
+    _b64encode = pybase64.b64encode
+    print(f"[MAP] base64 backend: pybase64 {pybase64.get_version()}")
+except ImportError:
+    _b64encode = base64.b64encode
+    print("[MAP] base64 backend: stdlib")
+
+
+@lru_cache(maxsize=256)
+def _file_b64(path: str, mtime: float) -> str:
+    """Base64 isi file; mtime ikut jadi key supaya file yang berubah di-encode ulang"""
+    with open(path, 'rb') as f:
+        return _b64encode(f.read()).decode('utf-8')
+
+
+# Writer background: ambil maksimal _WRITE_BATCH item per batch, tunggu
+# item susulan paling lama _WRITE_LINGER detik sebelum executemany
+_WRITE_BATCH = 64
+_WRITE_LINGER = 0.05
+
+# Parameter encode evidence image
+_EVIDENCE_JPEG_PARAMS = [cv2.IMWRITE_JPEG_QUALITY, 80, cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+
+# Statement yang sering dipakai: string identik tiap panggilan supaya
+# statement cache sqlite3 (cached_statements) selalu hit
+_SQLITE_CACHED_STATEMENTS = 256
+
+_SQL_INSERT_DAMAGE = """
+    INSERT INTO damages (
+        track_id, session_id, timestamp, latitude, longitude,
+        damage_type, confidence, image_path, bbox, severity
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+_SQL_DAMAGES_BY_SESSION = "SELECT * FROM damages WHERE session_id = ? ORDER BY timestamp"
+_SQL_DAMAGE_BY_ID = "SELECT * FROM damages WHERE id = ?"
+_SQL_COUNT_SESSION_DAMAGES = "SELECT COUNT(*) FROM damages WHERE session_id = ?"
+
 
 @dataclass
 class DamageRecord:
@@ -45,6 +91,14 @@ class DamageDatabase:
     - Export ke berbagai format
     """
     
+    _PRAGMAS = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA mmap_size=268435456",  # 256 MB
+        "PRAGMA cache_size=-20000",    # ~20 MB
+    )
+    
     def __init__(self, db_path: str = "results/roadguard.db", evidence_dir: str = "results/evidence"):
         self.db_path = db_path
         self.evidence_dir = evidence_dir
@@ -53,22 +107,51 @@ class DamageDatabase:
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
         os.makedirs(evidence_dir, exist_ok=True)
         
+        # Satu koneksi long-lived (autocommit, transaksi eksplisit di
+        # _get_connection); lock menyerialkan akses antar thread
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None,
+                                     cached_statements=_SQLITE_CACHED_STATEMENTS)
+        self._conn.row_factory = sqlite3.Row
+        # Naik setiap sesi dibuat/diakhiri/dihapus (key cache history di UI)
+        self._version = 0
+        # WAL: reader tidak terblok writer, fsync per commit jauh lebih jarang
+        for pragma in self._PRAGMAS:
+            self._conn.execute(pragma)
+        
         # Inisialisasi database
         self._create_tables()
+        
+        # Antrean tulis damage (lihat queue_damage), diproses thread daemon
+        self._write_q: "queue.Queue[tuple]" = queue.Queue()  # Row siap INSERT
+        self._writer = threading.Thread(target=self._writer_loop, name="damage_db_writer", daemon=True)
+        self._writer.start()
+        # Antrean yang tersisa tetap tersimpan saat proses server berhenti
+        atexit.register(self.close)
     
     @contextmanager
     def _get_connection(self):
-        """Context manager untuk koneksi database"""
-        conn = sqlite3.connect(self.db_path, check_same_thread=False)
-        conn.row_factory = sqlite3.Row
-        try:
-            yield conn
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            conn.close()
+        """Context manager: koneksi bersama dalam satu transaksi, di bawah lock"""
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except Exception as e:
+                conn.execute("ROLLBACK")
+                raise e
+    
+    @property
+    def version(self) -> int:
+        """Versi data sesi; berubah setiap create/end/delete"""
+        return self._version
+    
+    def close(self):
+        """Simpan antrean yang tersisa lalu tutup koneksi"""
+        self.flush()
+        with self._lock:
+            self._conn.close()
     
     def _create_tables(self):
         """Buat tabel-tabel yang diperlukan"""
@@ -117,6 +200,42 @@ class DamageDatabase:
             conn.execute("CREATE INDEX IF NOT EXISTS idx_damages_session ON damages(session_id)")
             conn.execute("CREATE INDEX IF NOT EXISTS idx_damages_type ON damages(damage_type)")
             conn.execute("CREATE INDEX IF NOT EXISTS idx_damages_location ON damages(latitude, longitude)")
+            
+            # R-Tree untuk query area; diisi lewat trigger supaya executemany
+            # (writer batch) ikut ter-index. Tidak semua build SQLite punya rtree.
+            self._has_rtree = True
+            try:
+                exists = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE name = 'damages_rtree'"
+                ).fetchone()
+                conn.execute("""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS damages_rtree
+                    USING rtree(id, minLat, maxLat, minLon, maxLon)
+                """)
+            except sqlite3.OperationalError:
+                self._has_rtree = False
+                exists = True
+            
+            if self._has_rtree:
+                conn.execute("""
+                    CREATE TRIGGER IF NOT EXISTS damages_rtree_insert AFTER INSERT ON damages
+                    BEGIN
+                        INSERT INTO damages_rtree
+                        VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+                    END
+                """)
+                conn.execute("""
+                    CREATE TRIGGER IF NOT EXISTS damages_rtree_delete AFTER DELETE ON damages
+                    BEGIN
+                        DELETE FROM damages_rtree WHERE id = old.id;
+                    END
+                """)
+                if not exists:
+                    # Backfill DB lama
+                    conn.execute("""
+                        INSERT INTO damages_rtree
+                        SELECT id, latitude, latitude, longitude, longitude FROM damages
+                    """)
     
     def create_session(self, video_source: str = "") -> str:
         """Buat sesi inspeksi baru, return session_id"""
@@ -127,17 +246,16 @@ class DamageDatabase:
                 INSERT INTO sessions (id, start_time, video_source, status)
                 VALUES (?, ?, ?, 'in_progress')
             """, (session_id, datetime.now().isoformat(), video_source))
+            self._version += 1
         
         return session_id
     
     def end_session(self, session_id: str, total_distance_km: float = 0, video_path: str = None):
         """Akhiri sesi inspeksi"""
+        self.flush()
         with self._get_connection() as conn:
             # Hitung total damages
-            cursor = conn.execute(
-                "SELECT COUNT(*) FROM damages WHERE session_id = ?", 
-                (session_id,)
-            )
+            cursor = conn.execute(_SQL_COUNT_SESSION_DAMAGES, (session_id,))
             total_damages = cursor.fetchone()[0]
             
             if video_path:
@@ -152,26 +270,19 @@ class DamageDatabase:
                     SET end_time = ?, total_damages = ?, total_distance_km = ?, status = 'completed'
                     WHERE id = ?
                 """, (datetime.now().isoformat(), total_damages, total_distance_km, session_id))
+            self._version += 1
     
-    def save_evidence_image(self, frame, damage_id: int = None) -> str:
-        """
-        Simpan frame sebagai evidence image.
-        
-        Args:
-            frame: OpenCV image (BGR)
-            damage_id: Optional ID untuk penamaan
-            
-        Returns:
-            Path relatif ke file gambar
-        """
-        # Pastikan directory exists
-        os.makedirs(self.evidence_dir, exist_ok=True)
-        
+    def _evidence_path(self, damage_id: int = None) -> str:
+        """Path file evidence baru (unik) di evidence_dir"""
         filename = f"{uuid.uuid4().hex[:12]}.jpg"
         if damage_id:
             filename = f"dmg_{damage_id}_{filename}"
-        
-        filepath = os.path.join(self.evidence_dir, filename)
+        return os.path.join(self.evidence_dir, filename)
+    
+    def _write_evidence(self, frame, filepath: str):
+        """Resize (max width 640px) dan tulis frame sebagai JPEG ke filepath"""
+        # Pastikan directory exists
+        os.makedirs(self.evidence_dir, exist_ok=True)
         
         # Resize untuk menghemat storage (max width 640px)
         h, w = frame.shape[:2]
@@ -180,17 +291,57 @@ class DamageDatabase:
             new_size = (640, int(h * scale))
             frame = cv2.resize(frame, new_size)
         
-        # Save dengan compression quality
-        cv2.imwrite(filepath, frame, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        # Encode di memori (quality 80 + optimized Huffman) lalu tulis bytes langsung
+        ok, buf = cv2.imencode('.jpg', frame, _EVIDENCE_JPEG_PARAMS)
+        if not ok:
+            raise ValueError(f"JPEG encode failed for {filepath}")
+        with open(filepath, 'wb') as f:
+            f.write(buf)
         
         # Debug: print path
         print(f"✅ Saved evidence image: {filepath}")
+    
+    def save_evidence_image(self, frame, damage_id: int = None) -> str:
+        """
+        Simpan frame sebagai evidence image.
         
+        Args:
+            frame: OpenCV image (BGR)
+            damage_id: Optional ID untuk penamaan
+            
+        Returns:
+            Path relatif ke file gambar
+        """
+        filepath = self._evidence_path(damage_id)
+        self._write_evidence(frame, filepath)
         return filepath
     
+    def _damage_row(self, data: dict, session_id: str, image_path: str) -> tuple:
+        """Susun parameter INSERT damages dari dictionary deteksi"""
+        # Konversi bbox ke JSON string
+        bbox_str = ""
+        if "bbox" in data and data["bbox"]:
+            bbox_str = json.dumps(data["bbox"])
+        
+        # Tentukan severity berdasarkan tipe dan confidence
+        severity = self._calculate_severity(data.get("type", ""), data.get("conf", 0.5))
+        
+        return (
+            data.get("track_id", 0),
+            session_id,
+            data.get("timestamp", 0),
+            data.get("lat", 0),
+            data.get("lon", 0),
+            data.get("type", "Unknown"),
+            data.get("conf", 0),
+            image_path,
+            bbox_str,
+            severity
+        )
+    
     def insert_damage(self, data: dict, session_id: str, frame_image=None) -> int:
         """
-        Simpan satu record kerusakan.
+        Simpan satu record kerusakan (blocking).
         
         Args:
             data: Dictionary dengan keys: track_id, timestamp, lat, lon, type, conf, bbox
@@ -205,35 +356,104 @@ class DamageDatabase:
         if frame_image is not None:
             image_path = self.save_evidence_image(frame_image)
         
-        # Konversi bbox ke JSON string
-        bbox_str = ""
-        if "bbox" in data and data["bbox"]:
-            bbox_str = json.dumps(data["bbox"])
-        
-        # Tentukan severity berdasarkan tipe dan confidence
-        severity = self._calculate_severity(data.get("type", ""), data.get("conf", 0.5))
-        
         with self._get_connection() as conn:
-            cursor = conn.execute("""
-                INSERT INTO damages (
-                    track_id, session_id, timestamp, latitude, longitude,
-                    damage_type, confidence, image_path, bbox, severity
-                )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                data.get("track_id", 0),
-                session_id,
-                data.get("timestamp", 0),
-                data.get("lat", 0),
-                data.get("lon", 0),
-                data.get("type", "Unknown"),
-                data.get("conf", 0),
-                image_path,
-                bbox_str,
-                severity
-            ))
+            cursor = conn.execute(_SQL_INSERT_DAMAGE,
+                                  self._damage_row(data, session_id, image_path))
             return cursor.lastrowid
     
+    def _insert_rows(self, rows: List[tuple]) -> List[int]:
+        """executemany INSERT damages dalam satu transaksi, return ID baru berurutan"""
+        if not rows:
+            return []
+        with self._get_connection() as conn:
+            conn.executemany(_SQL_INSERT_DAMAGE, rows)
+            # AUTOINCREMENT + satu koneksi di bawah lock -> ID batch ini berurutan
+            last_id = conn.execute(
+                "SELECT seq FROM sqlite_sequence WHERE name = 'damages'"
+            ).fetchone()[0]
+        return list(range(last_id - len(rows) + 1, last_id + 1))
+    
+    def insert_damages_batch(self, damages: List[dict], session_id: str,
+                             frame_images: Optional[List] = None) -> List[int]:
+        """
+        Simpan banyak record kerusakan dalam satu transaksi (executemany).
+        
+        Args:
+            damages: List dictionary (format sama dengan insert_damage)
+            session_id: ID sesi inspeksi
+            frame_images: Optional list OpenCV image sejajar dengan damages (None = tanpa gambar)
+            
+        Returns:
+            List ID record baru, urutan sama dengan damages
+        """
+        image_paths = [""] * len(damages)
+        if frame_images is not None:
+            jobs = [(i, img, self._evidence_path()) for i, img in enumerate(frame_images) if img is not None]
+            if jobs:
+                # Encode evidence paralel (cv2 melepas GIL) sebelum transaksi DB
+                with ThreadPoolExecutor(max_workers=min(4, len(jobs))) as pool:
+                    list(pool.map(lambda job: self._write_evidence(job[1], job[2]), jobs))
+                for i, _, path in jobs:
+                    image_paths[i] = path
+        
+        rows = [self._damage_row(d, session_id, path) for d, path in zip(damages, image_paths)]
+        return self._insert_rows(rows)
+    
+    def queue_damage(self, data: dict, session_id: str, frame_image=None) -> str:
+        """
+        Antrekan satu record kerusakan.
+        
+        Evidence image (crop kecil) langsung ditulis agar path yang
+        dikembalikan sudah bisa dibaca peta; INSERT dikerjakan thread writer
+        secara batch (executemany). Panggil flush() sebelum membaca data
+        sesi yang sama dari database.
+        
+        Args:
+            data: Dictionary dengan keys: track_id, timestamp, lat, lon, type, conf, bbox
+            session_id: ID sesi inspeksi
+            frame_image: Optional OpenCV image
+            
+        Returns:
+            Path evidence image ("" jika tanpa gambar atau gagal disimpan)
+        """
+        image_path = ""
+        if frame_image is not None:
+            image_path = self._evidence_path()
+            try:
+                self._write_evidence(frame_image, image_path)
+            except Exception as e:
+                print(f"❌ Error saving evidence image {image_path}: {e}")
+                image_path = ""
+        
+        self._write_q.put(self._damage_row(data, session_id, image_path))
+        return image_path
+    
+    def flush(self):
+        """Tunggu sampai semua damage di antrean tersimpan"""
+        self._write_q.join()
+    
+    def _writer_loop(self):
+        """Thread writer: kumpulkan batch dari antrean lalu executemany"""
+        while True:
+            batch = [self._write_q.get()]
+            deadline = time.monotonic() + _WRITE_LINGER
+            while len(batch) < _WRITE_BATCH:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._write_q.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            
+            try:
+                self._insert_rows(batch)
+            except Exception as e:
+                print(f"❌ Error saving {len(batch)} damages: {e}")
+            finally:
+                for _ in batch:
+                    self._write_q.task_done()
+    
     def _calculate_severity(self, damage_type: str, confidence: float) -> str:
         """Hitung severity berdasarkan tipe dan confidence"""
         # Pothole dan Alligator Crack dianggap lebih parah
@@ -255,18 +475,14 @@ class DamageDatabase:
     def get_damages_by_session(self, session_id: str) -> List[DamageRecord]:
         """Ambil semua kerusakan dari satu sesi"""
         with self._get_connection() as conn:
-            cursor = conn.execute("""
-                SELECT * FROM damages WHERE session_id = ? ORDER BY timestamp
-            """, (session_id,))
+            cursor = conn.execute(_SQL_DAMAGES_BY_SESSION, (session_id,))
             
             return [self._row_to_record(row) for row in cursor.fetchall()]
     
     def get_damage_by_id(self, damage_id: int) -> Optional[DamageRecord]:
         """Ambil satu damage record berdasarkan ID"""
         with self._get_connection() as conn:
-            cursor = conn.execute("""
-                SELECT * FROM damages WHERE id = ?
-            """, (damage_id,))
+            cursor = conn.execute(_SQL_DAMAGE_BY_ID, (damage_id,))
             
             row = cursor.fetchone()
             if row:
@@ -286,6 +502,19 @@ class DamageDatabase:
                             lon_min: float, lon_max: float) -> List[DamageRecord]:
         """Ambil kerusakan dalam area tertentu"""
         with self._get_connection() as conn:
+            if self._has_rtree:
+                # R-Tree (float32, dibulatkan keluar) sebagai pre-filter, BETWEEN presisi
+                cursor = conn.execute("""
+                    SELECT d.* FROM damages d
+                    JOIN damages_rtree r ON d.id = r.id
+                    WHERE r.maxLat >= ? AND r.minLat <= ?
+                    AND r.maxLon >= ? AND r.minLon <= ?
+                    AND d.latitude BETWEEN ? AND ?
+                    AND d.longitude BETWEEN ? AND ?
+                    ORDER BY d.created_at DESC
+                """, (lat_min, lat_max, lon_min, lon_max, lat_min, lat_max, lon_min, lon_max))
+                return [self._row_to_record(row) for row in cursor.fetchall()]
+            
             cursor = conn.execute("""
                 SELECT * FROM damages 
                 WHERE latitude BETWEEN ? AND ? 
@@ -340,12 +569,23 @@ class DamageDatabase:
                 "total_sessions": total_sessions
             }
     
-    def get_all_sessions(self) -> List[dict]:
-        """Ambil semua sesi inspeksi"""
+    def get_all_sessions(self, limit: Optional[int] = None, offset: int = 0) -> List[dict]:
+        """
+        Ambil sesi inspeksi (terbaru dulu).
+        
+        Args:
+            limit: Maksimal jumlah sesi (None = semua)
+            offset: Lewati n sesi pertama (untuk paginasi)
+        """
         with self._get_connection() as conn:
-            cursor = conn.execute("""
-                SELECT * FROM sessions ORDER BY start_time DESC
-            """)
+            if limit is None:
+                cursor = conn.execute("""
+                    SELECT * FROM sessions ORDER BY start_time DESC
+                """)
+            else:
+                cursor = conn.execute("""
+                    SELECT * FROM sessions ORDER BY start_time DESC LIMIT ? OFFSET ?
+                """, (limit, offset))
             return [dict(row) for row in cursor.fetchall()]
     
     def delete_damage(self, damage_id: int):
@@ -361,9 +601,11 @@ class DamageDatabase:
                 os.remove(row[0])
             
             conn.execute("DELETE FROM damages WHERE id = ?", (damage_id,))
+            self._version += 1
     
     def delete_session(self, session_id: str):
         """Hapus sesi beserta semua damage-nya"""
+        self.flush()
         with self._get_connection() as conn:
             # Hapus gambar evidence
             cursor = conn.execute(
@@ -377,6 +619,7 @@ class DamageDatabase:
             # Hapus records
             conn.execute("DELETE FROM damages WHERE session_id = ?", (session_id,))
             conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._version += 1
     
     def export_to_csv(self, filepath: str, session_id: str = None):
         """Export data ke CSV"""
@@ -457,11 +700,13 @@ class DamageDatabase:
     
     def get_image_base64(self, image_path: str) -> str:
         """Baca gambar dan konversi ke base64 untuk display di web"""
-        if not image_path or not os.path.exists(image_path):
+        if not image_path:
             return ""
-        
-        with open(image_path, 'rb') as f:
-            return base64.b64encode(f.read()).decode('utf-8')
+        try:
+            mtime = os.path.getmtime(image_path)
+        except OSError:
+            return ""
+        return _file_b64(image_path, mtime)
 
 
 # Singleton instance untuk digunakan di seluruh aplikasi
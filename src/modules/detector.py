@@ -4,8 +4,12 @@ Menggunakan YOLOv8 untuk deteksi kerusakan jalan.
 """
 
 import cv2
+import numpy as np
+import queue
+import threading
 import time
 import os
+from functools import lru_cache
 from ultralytics import YOLO
 from typing import List, Dict, Tuple, Optional
 
@@ -27,6 +31,131 @@ LABEL_MAP = {
 }
 
 
+# Pattern (substring lowercase -> label) untuk nama kelas model yang
+# tidak ada di LABEL_MAP; dicek berurutan, match pertama dipakai
+_LABEL_PATTERNS = (
+    ('d00', "Longitudinal Crack"),
+    ('longitudinal', "Longitudinal Crack"),
+    ('d10', "Transverse Crack"),
+    ('transverse', "Transverse Crack"),
+    ('d20', "Alligator Crack"),
+    ('alligator', "Alligator Crack"),
+    ('d40', "Pothole"),
+    ('pothole', "Pothole"),
+)
+
+
+def _build_label_map(names: Dict[int, str]) -> Dict[str, str]:
+    """Label map default + mapping kelas model berdasarkan pattern nama"""
+    label_map = LABEL_MAP.copy()
+    for name in names.values():
+        if name in label_map:
+            continue
+        name_lower = name.lower()
+        for pattern, readable in _LABEL_PATTERNS:
+            if pattern in name_lower:
+                label_map[name] = readable
+                break
+    return label_map
+
+
+@lru_cache(maxsize=4)
+def _load_model(model_path: str, mtime: float):
+    """
+    Load YOLO sekali per file model, dipakai bersama antar instance.
+    
+    mtime ikut jadi key cache supaya model yang di-train/export ulang
+    ter-load ulang. Predictor ultralytics tidak thread-safe, jadi setiap
+    pemanggilan model harus memegang lock yang dikembalikan.
+    
+    Returns:
+        (model, label_map, lock)
+    """
+    model = YOLO(model_path, task='detect')
+    return model, _build_label_map(model.names), threading.Lock()
+
+
+def _prefer_engine(model_path: str) -> str:
+    """Pakai engine TensorRT (.engine) di sebelah file .pt jika sudah ada"""
+    stem, ext = os.path.splitext(model_path)
+    if ext == '.pt' and os.path.exists(stem + '.engine'):
+        return stem + '.engine'
+    return model_path
+
+
+# Warna bbox (BGR) untuk anotasi frame
+_BOX_COLOR = (0, 255, 0)
+
+
+def draw_detections(frame, detections: List[Dict]):
+    """
+    Gambar bbox + label deteksi langsung (in-place) di frame.
+    
+    Args:
+        frame: OpenCV image (BGR)
+        detections: List deteksi (format detect())
+        
+    Returns:
+        Frame yang sama (sudah teranotasi)
+    """
+    for det in detections:
+        x1, y1, x2, y2 = [int(c) for c in det['bbox']]
+        cv2.rectangle(frame, (x1, y1), (x2, y2), _BOX_COLOR, 2)
+        cv2.putText(frame, f"{det['raw_label']} {det['conf']:.2f}", (x1, max(y1 - 6, 12)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, _BOX_COLOR, 1, cv2.LINE_AA)
+    return frame
+
+
+def _open_capture(video_path):
+    """
+    Buka video dengan decode hardware (NVDEC/VAAPI/...) jika tersedia.
+    
+    Fallback ke VideoCapture default jika OpenCV tidak mendukung
+    parameter HW acceleration atau backend FFMPEG gagal membuka file.
+    """
+    hw_any = getattr(cv2, 'VIDEO_ACCELERATION_ANY', None)
+    if hw_any is not None and not isinstance(video_path, int):
+        try:
+            cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG,
+                                   [cv2.CAP_PROP_HW_ACCELERATION, hw_any])
+            if cap.isOpened():
+                return cap
+            cap.release()
+        except cv2.error:
+            pass
+    return cv2.VideoCapture(video_path)
+
+
+def _q_put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    """put yang bisa dibatalkan lewat stop (False jika dibatalkan)"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _q_get(q: queue.Queue, stop: threading.Event):
+    """get yang bisa dibatalkan lewat stop (None jika dibatalkan)"""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return None
+
+
+def _supports_int8(device=0) -> bool:
+    """GPU punya INT8 tensor core (Xavier/Turing ke atas, compute capability >= 7.2)"""
+    try:
+        import torch
+        return torch.cuda.is_available() and torch.cuda.get_device_capability(device) >= (7, 2)
+    except Exception:
+        return False
+
+
 class RoadDamageDetector:
     """
     Detector untuk kerusakan jalan menggunakan YOLOv8.
@@ -38,25 +167,32 @@ class RoadDamageDetector:
         model: YOLO model instance
         label_map: Dictionary untuk mapping label
         confidence_threshold: Default confidence threshold
+        inference_lock: Lock model bersama; pegang saat memanggil model(...)
     """
     
-    def __init__(self, model_path: str = None, confidence_threshold: float = 0.35):
+    def __init__(self, model_path: str = None, confidence_threshold: float = 0.35,
+                 batch_size: int = 8, imgsz: int = 640):
         """
         Initialize detector.
         
         Args:
             model_path: Path ke file model .pt
             confidence_threshold: Minimum confidence untuk deteksi
+            batch_size: Jumlah frame per panggilan model di process_video
+                (4/8/16; turunkan jika VRAM penuh)
+            imgsz: Ukuran input model; frame lebih besar di-resize di CPU
         """
         self.confidence_threshold = confidence_threshold
-        self.label_map = LABEL_MAP.copy()
+        self.batch_size = max(1, batch_size)
+        self.imgsz = imgsz
         
         # Cari model path
         if model_path and os.path.exists(model_path):
-            self.model_path = model_path
+            self.model_path = _prefer_engine(model_path)
         else:
-            # Coba beberapa lokasi
+            # Coba beberapa lokasi (engine TensorRT dulu jika sudah di-build)
             possible_paths = [
+                'src/models/YOLOv8_Small_RDD.engine',
                 'src/models/YOLOv8_Small_RDD.pt'
             ]
             self.model_path = None
@@ -70,26 +206,13 @@ class RoadDamageDetector:
                     f"Model not found. Tried: {possible_paths}"
                 )
         
-        # Load model
-        self.model = YOLO(self.model_path)
-        
-        # Update label map dengan nama dari model
-        self._update_label_map()
-    
-    def _update_label_map(self):
-        """Update label map berdasarkan kelas dari model"""
-        for idx, name in self.model.names.items():
-            if name not in self.label_map:
-                # Coba map berdasarkan pattern
-                name_lower = name.lower()
-                if 'd00' in name_lower or 'longitudinal' in name_lower:
-                    self.label_map[name] = "Longitudinal Crack"
-                elif 'd10' in name_lower or 'transverse' in name_lower:
-                    self.label_map[name] = "Transverse Crack"
-                elif 'd20' in name_lower or 'alligator' in name_lower:
-                    self.label_map[name] = "Alligator Crack"
-                elif 'd40' in name_lower or 'pothole' in name_lower:
-                    self.label_map[name] = "Pothole"
+        # Load model (cached per file) + label map dengan nama dari model
+        model, label_map, lock = _load_model(self.model_path, os.path.getmtime(self.model_path))
+        self.model = model
+        self.label_map = label_map.copy()
+        # Model dipakai bersama antar instance/thread: pegang lock ini
+        # setiap memanggil self.model(...)
+        self.inference_lock = lock
     
     def get_readable_label(self, raw_label: str) -> str:
         """Convert raw label ke human-readable label"""
@@ -111,96 +234,300 @@ class RoadDamageDetector:
             - raw_label: original model label
         """
         conf = confidence or self.confidence_threshold
+        return self._infer([frame], conf)[0]
+    
+    def _infer(self, frames: List, conf: float) -> List[List[Dict]]:
+        """
+        Inference batch. Frame yang lebih besar dari imgsz di-resize di CPU
+        (INTER_AREA) sebelum dikirim ke model, bbox dikembalikan ke koordinat
+        frame asli.
+        """
+        inputs, scales = [], []
+        for frame in frames:
+            h, w = frame.shape[:2]
+            s = self.imgsz / max(h, w)
+            if s < 1:
+                new_w, new_h = max(1, round(w * s)), max(1, round(h * s))
+                inputs.append(cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_AREA))
+                scales.append((w / new_w, h / new_h))
+            else:
+                inputs.append(frame)
+                scales.append(None)
         
-        results = self.model(frame, conf=conf, verbose=False)
+        with self.inference_lock:
+            results = self.model(inputs, conf=conf, imgsz=self.imgsz, verbose=False)
+            return [self._extract_detections(r, scale) for r, scale in zip(results, scales)]
+    
+    def _extract_detections(self, result, scale: Optional[Tuple[float, float]] = None) -> List[Dict]:
+        """Konversi satu hasil YOLO ke list deteksi (satu transfer .cpu() per tensor)"""
+        boxes = result.boxes
+        if not boxes:
+            return []
         
-        detections = []
+        xyxy = boxes.xyxy.cpu().numpy()
+        if scale is not None:
+            sx, sy = scale
+            xyxy = xyxy * np.array([sx, sy, sx, sy], dtype=xyxy.dtype)
+        xyxy = xyxy.tolist()
+        cls_ids = boxes.cls.cpu().numpy().astype(np.int32).tolist()
+        confs = boxes.conf.cpu().numpy().tolist()
+        names = self.model.names
+        label_map = self.label_map
         
-        if results[0].boxes:
-            for box in results[0].boxes:
-                xyxy = box.xyxy[0].tolist()
-                cls_id = int(box.cls[0])
-                conf_score = float(box.conf[0])
-                raw_label = self.model.names[cls_id]
-                
-                detections.append({
-                    "bbox": xyxy,
-                    "type": self.get_readable_label(raw_label),
-                    "conf": conf_score,
-                    "raw_label": raw_label,
-                    "class_id": cls_id
-                })
-        
-        return detections
+        return [
+            {
+                "bbox": bbox,
+                "type": label_map.get(names[cls_id], names[cls_id]),
+                "conf": conf_score,
+                "raw_label": names[cls_id],
+                "class_id": cls_id
+            }
+            for bbox, cls_id, conf_score in zip(xyxy, cls_ids, confs)
+        ]
     
-    def detect_and_annotate(self, frame, confidence: float = None) -> Tuple:
+    def detect_and_annotate(self, frame, confidence: float = None, inplace: bool = False):
         """
         Detect damages and return annotated frame.
         
+        Anotasi digambar langsung dengan cv2 (tanpa results.plot() yang
+        meng-copy frame dan me-render ulang via ultralytics).
+        
         Args:
-            frame: OpenCV image (BGR)
+            frame: OpenCV image (BGR), atau list frame untuk inference batch
             confidence: Override confidence threshold
+            inplace: Gambar bbox langsung di frame input (tanpa copy)
             
         Returns:
-            (annotated_frame, detections_list)
+            (annotated_frame, detections_list), atau list tuple tersebut
+            jika frame berupa list
         """
         conf = confidence or self.confidence_threshold
         
-        results = self.model(frame, conf=conf, verbose=False)
-        annotated_frame = results[0].plot()
+        frames = frame if isinstance(frame, list) else [frame]
+        annotated = []
+        for img, detections in zip(frames, self._infer(frames, conf)):
+            canvas = img if inplace else img.copy()
+            annotated.append((draw_detections(canvas, detections), detections))
         
-        detections = []
-        
-        if results[0].boxes:
-            for box in results[0].boxes:
-                xyxy = box.xyxy[0].tolist()
-                cls_id = int(box.cls[0])
-                conf_score = float(box.conf[0])
-                raw_label = self.model.names[cls_id]
-                
-                detections.append({
-                    "bbox": xyxy,
-                    "type": self.get_readable_label(raw_label),
-                    "conf": conf_score,
-                    "raw_label": raw_label,
-                    "class_id": cls_id
-                })
-        
-        return annotated_frame, detections
+        if isinstance(frame, list):
+            return annotated
+        return annotated[0]
     
-    def process_video(self, video_path: str, callback=None):
+    def process_video(self, video_path: str, callback=None, prefetch: int = None,
+                      annotate: bool = True, frame_stride: int = 1,
+                      drop_when_behind: bool = False):
         """
-        Process video file frame by frame.
+        Process video file dengan pipeline 3 tahap yang berjalan bersamaan:
+        reader (decode) -> compute (inference batch) -> post (konversi RGB).
+        Antar tahap dihubungkan queue terbatas (prefetch item).
         
         Args:
             video_path: Path to video file
             callback: Optional callback function(frame, detections, frame_idx)
+            prefetch: Kapasitas tiap queue (default 2x batch_size)
+            annotate: False = hanya deteksi, frame yang di-yield None
+            frame_stride: Proses 1 dari tiap N frame; sisanya hanya di-grab
+            drop_when_behind: Lewati frame (grab) selama queue inference
+                penuh, agar latency tidak menumpuk (untuk stream realtime)
+            
+        Statistik decode ada di self.last_video_stats:
+        {'processed', 'skipped', 'skip_rate', 'hw_accel'}.
             
         Yields:
-            (annotated_frame_rgb, detections, frame_idx)
+            (annotated_frame_rgb, detections, frame_idx). annotated_frame_rgb
+            adalah view non-contiguous dari frame BGR; pakai
+            np.ascontiguousarray jika consumer butuh memori contiguous.
         """
-        cap = cv2.VideoCapture(video_path)
-        frame_idx = 0
+        prefetch = prefetch or 2 * self.batch_size
+        frame_stride = max(1, int(frame_stride))
+        cap = _open_capture(video_path)
+        stats = {
+            'processed': 0,
+            'skipped': 0,
+            'skip_rate': 0.0,
+            'hw_accel': bool(cap.get(getattr(cv2, 'CAP_PROP_HW_ACCELERATION', -1)) > 0)
+        }
+        self.last_video_stats = stats
+        read_q = queue.Queue(maxsize=prefetch)
+        post_q = queue.Queue(maxsize=prefetch)
+        out_q = queue.Queue(maxsize=prefetch)
+        stop = threading.Event()
         
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            frame_idx += 1
-            
-            # Detect and annotate
-            annotated_frame, detections = self.detect_and_annotate(frame)
+        def reader():
+            frame_idx = 0
+            try:
+                while cap.isOpened() and not stop.is_set():
+                    # Frame yang dilewati cukup di-grab, tanpa retrieve ke BGR
+                    if drop_when_behind and read_q.full():
+                        if not cap.grab():
+                            break
+                        frame_idx += 1
+                        stats['skipped'] += 1
+                        continue
+                    
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    frame_idx += 1
+                    stats['processed'] += 1
+                    if not _q_put(read_q, (frame_idx, frame), stop):
+                        return
+                    
+                    for _ in range(frame_stride - 1):
+                        if not cap.grab():
+                            return
+                        frame_idx += 1
+                        stats['skipped'] += 1
+            finally:
+                total = stats['processed'] + stats['skipped']
+                stats['skip_rate'] = stats['skipped'] / total if total else 0.0
+                _q_put(read_q, None, stop)
+        
+        def compute():
+            pending = []
             
-            # Convert to RGB for display
-            rgb_frame = cv2.cvtColor(annotated_frame, cv2.COLOR_BGR2RGB)
+            def flush():
+                frames = [frame for _, frame in pending]
+                if annotate:
+                    # Frame milik pipeline; copy hanya jika callback butuh frame asli
+                    results = self.detect_and_annotate(frames, inplace=callback is None)
+                else:
+                    results = [(None, detections)
+                               for detections in self._infer(frames, self.confidence_threshold)]
+                for (frame_idx, frame), (annotated_frame, detections) in zip(pending, results):
+                    if not _q_put(post_q, (frame_idx, frame, annotated_frame, detections), stop):
+                        return False
+                pending.clear()
+                return True
             
-            if callback:
-                callback(frame, detections, frame_idx)
+            try:
+                while True:
+                    item = _q_get(read_q, stop)
+                    if item is None:
+                        if pending:
+                            flush()
+                        break
+                    pending.append(item)
+                    if len(pending) == self.batch_size and not flush():
+                        return
+            except Exception as e:
+                _q_put(post_q, e, stop)
+                return
+            _q_put(post_q, None, stop)
+        
+        def post():
+            while True:
+                item = _q_get(post_q, stop)
+                if item is None or isinstance(item, Exception):
+                    _q_put(out_q, item, stop)
+                    return
+                frame_idx, frame, annotated_frame, detections = item
+                # RGB sebagai view (channel dibalik), tanpa copy frame penuh
+                rgb_frame = None
+                if annotated_frame is not None:
+                    rgb_frame = annotated_frame[..., ::-1]
+                if not _q_put(out_q, (rgb_frame, detections, frame_idx, frame), stop):
+                    return
+        
+        threads = [threading.Thread(target=fn, name=f"video_{fn.__name__}", daemon=True)
+                   for fn in (reader, compute, post)]
+        for t in threads:
+            t.start()
+        
+        try:
+            while True:
+                item = out_q.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                rgb_frame, detections, frame_idx, frame = item
+                
+                if callback:
+                    callback(frame, detections, frame_idx)
+                
+                yield rgb_frame, detections, frame_idx
+        finally:
+            stop.set()
+            for t in threads:
+                t.join()
+            cap.release()
+    
+    def build_engine(self, imgsz: int = 640, batch: int = None, device=0,
+                     int8: bool = False, calib_video: str = None, num_frames: int = 300) -> str:
+        """
+        Export model .pt ke engine TensorRT (sekali saja, butuh GPU NVIDIA).
+        
+        Engine disimpan di sebelah file .pt dan otomatis dipakai saat
+        RoadDamageDetector dibuat berikutnya.
+        
+        Args:
+            imgsz: Ukuran input model
+            batch: Batch maksimum engine (default self.batch_size)
+            device: Index GPU
+            int8: Engine INT8 (kalibrasi dari calib_video); fallback FP16 jika
+                GPU tidak punya INT8 tensor core
+            calib_video: Video jalan untuk sampel frame kalibrasi INT8
+            num_frames: Jumlah frame kalibrasi
             
-            yield rgb_frame, detections, frame_idx
+        Returns:
+            Path file .engine
+        """
+        pt_path = os.path.splitext(self.model_path)[0] + '.pt'
+        export_args = dict(format='engine', imgsz=imgsz, dynamic=True,
+                           batch=batch or self.batch_size, device=device)
+        
+        if int8 and calib_video and _supports_int8(device):
+            export_args.update(int8=True, data=self._prepare_calibration(pt_path, calib_video, num_frames))
+        else:
+            if int8:
+                print("⚠️ INT8 tidak tersedia (GPU/video kalibrasi), build engine FP16")
+            export_args.update(half=True)
+        
+        return YOLO(pt_path).export(**export_args)
+    
+    def _prepare_calibration(self, pt_path: str, video_path: str, num_frames: int) -> str:
+        """
+        Sampel frame dari video jalan ke folder kalibrasi + tulis calib.yaml.
+        
+        Folder yang sudah berisi cukup frame dipakai ulang (kalibrasi ulang
+        juga cepat karena cache TensorRT disimpan di sebelah engine).
+        
+        Returns:
+            Path calib.yaml
+        """
+        calib_dir = os.path.splitext(pt_path)[0] + '_calib'
+        image_dir = os.path.join(calib_dir, 'images')
+        yaml_path = os.path.join(calib_dir, 'calib.yaml')
+        os.makedirs(image_dir, exist_ok=True)
+        
+        existing = [f for f in os.listdir(image_dir) if f.endswith('.jpg')]
+        if len(existing) < num_frames:
+            cap = cv2.VideoCapture(video_path)
+            total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or num_frames
+            step = max(1, total // num_frames)
+            idx = saved = 0
+            try:
+                while saved < num_frames:
+                    # grab() tanpa decode untuk frame yang dilewati
+                    if not cap.grab():
+                        break
+                    if idx % step == 0:
+                        ret, frame = cap.retrieve()
+                        if ret:
+                            cv2.imwrite(os.path.join(image_dir, f"calib_{saved:05d}.jpg"), frame)
+                            saved += 1
+                    idx += 1
+            finally:
+                cap.release()
+        
+        with open(yaml_path, 'w', encoding='utf-8') as f:
+            f.write(f"path: {os.path.abspath(calib_dir)}\n")
+            f.write("train: images\nval: images\nnames:\n")
+            for cls_id, name in self.model.names.items():
+                f.write(f"  {cls_id}: {name}\n")
         
-        cap.release()
+        return yaml_path
     
     def get_model_info(self) -> Dict:
         """Get information about the loaded model"""
@@ -6,9 +6,23 @@ Mengelola data GPS dari berbagai sumber: simulasi, CSV, GPX, manual input, atau
 import pandas as pd
 import numpy as np
 import xml.etree.ElementTree as ET
-from math import radians, cos, sin, asin, sqrt
+from math import radians as _rad, cos as _cos, sin as _sin, asin as _asin, sqrt as _sqrt
 from typing import Tuple, Optional, List, Callable
 
+# Parser GPX berbasis C (opsional), fallback ke xml.etree
+try:
+    from lxml import etree as _lxml_etree
+    HAS_LXML = True
+except ImportError:
+    HAS_LXML = False
+
+# Numba opsional: kernel haversine/interpolasi skalar di-JIT
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
 # Import realtime GPS
 try:
     from modules.realtime_gps import get_realtime_gps, RealtimeGPS
@@ -22,6 +36,100 @@ import os
 import streamlit as st
 
 
+EARTH_RADIUS_M = 6371000  # Jari-jari bumi (meter)
+
+
+def _parse_time_column(col: pd.Series) -> np.ndarray:
+    """
+    Konversi kolom waktu CSV ke detik.
+    
+    Mendukung angka (detik/frame) dan string 'HH:MM:SS', boleh campur.
+    """
+    if pd.api.types.is_numeric_dtype(col):
+        return col.to_numpy(dtype=np.float64)
+    
+    text = col.astype(str)
+    is_hms = text.str.contains(':', regex=False).to_numpy()
+    
+    seconds = np.empty(len(col), dtype=np.float64)
+    if is_hms.any():
+        seconds[is_hms] = pd.to_timedelta(text[is_hms]).dt.total_seconds().to_numpy()
+    if not is_hms.all():
+        seconds[~is_hms] = pd.to_numeric(col[~is_hms]).to_numpy(dtype=np.float64)
+    return seconds
+
+
+def _cumulative_distance(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """
+    Jarak Haversine kumulatif (meter) sepanjang rangkaian titik.
+    
+    Returns:
+        Array (N,) dengan cum[0] = 0 dan cum[i] = jarak titik 0..i
+    """
+    lat_rad = np.radians(lat)
+    lon_rad = np.radians(lon)
+    dlat = np.diff(lat_rad)
+    dlon = np.diff(lon_rad)
+    
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat_rad[:-1]) * np.cos(lat_rad[1:]) * np.sin(dlon / 2) ** 2
+    seg = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+    
+    cum = np.empty(len(lat), dtype=np.float64)
+    if len(cum):
+        cum[0] = 0.0
+        np.cumsum(seg, out=cum[1:])
+    return cum
+
+
+def _haversine_py(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Jarak Haversine (meter) antara dua titik"""
+    lat1 = _rad(lat1)
+    lat2 = _rad(lat2)
+    dlat = lat2 - lat1
+    dlon = _rad(lon2 - lon1)
+    
+    a = _sin(dlat * 0.5) ** 2 + _cos(lat1) * _cos(lat2) * _sin(dlon * 0.5) ** 2
+    return 2 * EARTH_RADIUS_M * _asin(_sqrt(a))
+
+
+def _interp_py(t: float, ts: np.ndarray, lats: np.ndarray,
+               lons: np.ndarray) -> Tuple[float, float]:
+    """
+    Interpolasi linear lokasi pada waktu t (binary search).
+    
+    Args:
+        t: Waktu (detik)
+        ts: Timestamp terurut (N,), N >= 1
+        lats, lons: Koordinat sejajar ts
+    """
+    # Index titik pertama dengan timestamp >= t
+    i = np.searchsorted(ts, t)
+    if i <= 0:
+        return float(lats[0]), float(lons[0])
+    if i >= len(ts):
+        return float(lats[-1]), float(lons[-1])
+    
+    # ts[i-1] < t <= ts[i]
+    t0 = ts[i - 1]
+    a = (t - t0) / (ts[i] - t0)
+    
+    lat = lats[i - 1] + a * (lats[i] - lats[i - 1])
+    lon = lons[i - 1] + a * (lons[i] - lons[i - 1])
+    return float(lat), float(lon)
+
+
+if HAS_NUMBA:
+    _haversine_scalar = njit(cache=True, fastmath=True)(_haversine_py)
+    _interp_scalar = njit(cache=True, fastmath=True)(_interp_py)
+    
+    # Warm-up supaya panggilan pertama saat proses video tidak kena kompilasi
+    _haversine_scalar(0.0, 0.0, 0.0, 0.0)
+    _interp_scalar(0.0, np.zeros(1), np.zeros(1), np.zeros(1))
+else:
+    _haversine_scalar = _haversine_py
+    _interp_scalar = _interp_py
+
+
 @dataclass
 class GPSPoint:
     """Satu titik GPS"""
@@ -33,6 +141,17 @@ class GPSPoint:
     accuracy: float = 0.0  # meter
 
 
+@dataclass
+class GPSConfig:
+    """Konfigurasi sumber GPS dari sidebar"""
+    mode: str = "simulation"  # realtime | simulation | manual | gpx | csv
+    start_lat: float = -6.9024
+    start_lon: float = 107.6188
+    end_lat: float = -6.9024
+    end_lon: float = 107.6188
+    file_path: Optional[str] = None
+
+
 class GPSManager:
     """
     Manager untuk data GPS yang mendukung berbagai sumber input:
@@ -47,7 +166,20 @@ class GPSManager:
                  start_lat: float = -6.9024, 
                  start_lon: float = 107.6188):
         self.mode = mode
-        self.data: List[GPSPoint] = []
+        
+        # Data rute disimpan sebagai array (SoA), terurut per timestamp.
+        # List GPSPoint (self.data) hanya dibuat jika diminta.
+        self._ts = np.empty(0, dtype=np.float64)
+        self._lat = np.empty(0, dtype=np.float64)
+        self._lon = np.empty(0, dtype=np.float64)
+        self._ele = np.empty(0, dtype=np.float64)
+        self._points: Optional[List[GPSPoint]] = None
+        
+        # Lokasi per-frame hasil precompute_track (None = belum dihitung)
+        self._lat_track: Optional[np.ndarray] = None
+        self._lon_track: Optional[np.ndarray] = None
+        self._cum_dist_m: Optional[np.ndarray] = None
+        self._track_fps = 0.0
         
         # Untuk simulasi
         self.start_lat = start_lat
@@ -64,6 +196,7 @@ class GPSManager:
         self.total_distance_meters = 0.0
         self._prev_lat = start_lat
         self._prev_lon = start_lon
+        self._prev_cos_lat: Optional[float] = None  # cache cos(lat) titik sebelumnya
         
         # Untuk realtime GPS
         self._realtime_gps: Optional[RealtimeGPS] = None
@@ -71,6 +204,27 @@ class GPSManager:
             self._realtime_gps = get_realtime_gps()
             self._realtime_gps.set_fallback(start_lat, start_lon)
         
+    @property
+    def data(self) -> List[GPSPoint]:
+        """Titik GPS rute sebagai list GPSPoint (dibuat saat pertama diminta)"""
+        if self._points is None:
+            self._points = [
+                GPSPoint(latitude=lat, longitude=lon, timestamp=ts, elevation=ele)
+                for lat, lon, ts, ele in zip(self._lat.tolist(), self._lon.tolist(),
+                                             self._ts.tolist(), self._ele.tolist())
+            ]
+        return self._points
+    
+    @data.setter
+    def data(self, points: List[GPSPoint]):
+        n = len(points)
+        self._set_arrays(
+            np.fromiter((p.timestamp for p in points), dtype=np.float64, count=n),
+            np.fromiter((p.latitude for p in points), dtype=np.float64, count=n),
+            np.fromiter((p.longitude for p in points), dtype=np.float64, count=n),
+            np.fromiter((p.elevation for p in points), dtype=np.float64, count=n)
+        )
+    
     def set_realtime_mode(self, session_key: str = 'realtime_gps_main'):
         """Set GPS manager ke mode realtime."""
         self.mode = 'realtime'
@@ -165,44 +319,32 @@ class GPSManager:
                     time_col = col
                     break
             
-            # Parse data
-            self.data = []
-            for idx, row in df.iterrows():
-                # Determine timestamp
-                if time_col:
-                    ts_value = row[time_col]
-                    if isinstance(ts_value, str) and ':' in ts_value:
-                        # Format HH:MM:SS
-                        parts = ts_value.split(':')
-                        timestamp = float(parts[0])*3600 + float(parts[1])*60 + float(parts[2])
-                    else:
-                        timestamp = float(ts_value)
-                else:
-                    # Gunakan index sebagai timestamp (1 row = 1 detik)
-                    timestamp = float(idx)
-                
-                # Elevation opsional
-                elevation = 0.0
-                for col in ['elevation', 'alt', 'altitude', 'elev']:
-                    if col in df.columns:
-                        elevation = float(row[col]) if pd.notna(row[col]) else 0.0
-                        break
-                
-                self.data.append(GPSPoint(
-                    latitude=float(row[lat_col]),
-                    longitude=float(row[lon_col]),
-                    timestamp=timestamp,
-                    elevation=elevation
-                ))
+            # Parse data (per kolom, tanpa iterrows)
+            lats = df[lat_col].to_numpy(dtype=np.float64)
+            lons = df[lon_col].to_numpy(dtype=np.float64)
+            
+            if time_col:
+                timestamps = _parse_time_column(df[time_col])
+            else:
+                # Gunakan index sebagai timestamp (1 row = 1 detik)
+                timestamps = df.index.to_numpy(dtype=np.float64)
+            
+            # Elevation opsional
+            elevations = np.zeros(len(df), dtype=np.float64)
+            for col in ['elevation', 'alt', 'altitude', 'elev']:
+                if col in df.columns:
+                    elevations = df[col].fillna(0.0).to_numpy(dtype=np.float64)
+                    break
             
             self.mode = 'csv'
-            if self.data:
-                self.start_lat = self.data[0].latitude
-                self.start_lon = self.data[0].longitude
+            self._set_arrays(timestamps, lats, lons, elevations)
+            if len(lats):
+                self.start_lat = float(lats[0])
+                self.start_lon = float(lons[0])
                 self.last_lat = self.start_lat
                 self.last_lon = self.start_lon
             
-            return len(self.data) > 0
+            return len(lats) > 0
             
         except Exception as e:
             print(f"Error loading CSV: {e}")
@@ -226,64 +368,64 @@ class GPSManager:
             return False
         
         try:
-            tree = ET.parse(gpx_path)
-            root = tree.getroot()
-            
-            # Handle namespace GPX
-            ns = {'gpx': 'http://www.topografix.com/GPX/1/1'}
-            
-            # Coba tanpa namespace dulu
-            trkpts = root.findall('.//trkpt')
-            if not trkpts:
-                # Coba dengan namespace
-                trkpts = root.findall('.//gpx:trkpt', ns)
+            # Streaming parse: titik dibaca lalu langsung di-clear.
+            # Tag dicocokkan tanpa namespace (GPX 1.0/1.1/tanpa namespace).
+            iterparse = _lxml_etree.iterparse if HAS_LXML else ET.iterparse
+            points = {'trkpt': ([], [], [], []), 'wpt': ([], [], [], [])}
             
-            if not trkpts:
-                # Coba waypoints
-                trkpts = root.findall('.//wpt')
-                if not trkpts:
-                    trkpts = root.findall('.//gpx:wpt', ns)
-            
-            self.data = []
-            base_time = None
-            
-            for pt in trkpts:
-                lat = float(pt.get('lat'))
-                lon = float(pt.get('lon'))
+            for _, elem in iterparse(gpx_path, events=('end',)):
+                tag = elem.tag
+                if not isinstance(tag, str):
+                    continue  # Komentar / processing instruction (lxml)
+                kind = tag.rsplit('}', 1)[-1]
+                if kind not in points:
+                    continue
                 
-                # Elevation
-                ele_elem = pt.find('ele') or pt.find('gpx:ele', ns)
-                elevation = float(ele_elem.text) if ele_elem is not None else 0.0
+                lat_buf, lon_buf, ele_buf, time_buf = points[kind]
+                lat_buf.append(float(elem.get('lat')))
+                lon_buf.append(float(elem.get('lon')))
                 
-                # Time
-                time_elem = pt.find('time') or pt.find('gpx:time', ns)
-                if time_elem is not None:
-                    # Parse ISO format: 2024-01-15T10:30:45Z
-                    try:
-                        dt = datetime.fromisoformat(time_elem.text.replace('Z', '+00:00'))
-                        if base_time is None:
-                            base_time = dt
-                        timestamp = (dt - base_time).total_seconds()
-                    except:
-                        timestamp = len(self.data)
-                else:
-                    timestamp = len(self.data)
+                ele_text = None
+                time_text = None
+                for child in elem:
+                    if not isinstance(child.tag, str):
+                        continue
+                    name = child.tag.rsplit('}', 1)[-1]
+                    if name == 'ele':
+                        ele_text = child.text
+                    elif name == 'time':
+                        time_text = child.text
                 
-                self.data.append(GPSPoint(
-                    latitude=lat,
-                    longitude=lon,
-                    timestamp=timestamp,
-                    elevation=elevation
-                ))
+                ele_buf.append(float(ele_text) if ele_text else 0.0)
+                time_buf.append(time_text)
+                elem.clear()
+            
+            # Utamakan track points, fallback ke waypoints
+            lats, lons, elevations, times = points['trkpt'] if points['trkpt'][0] else points['wpt']
+            lats = np.array(lats, dtype=np.float64)
+            lons = np.array(lons, dtype=np.float64)
+            elevations = np.array(elevations, dtype=np.float64)
+            
+            # Time ISO (2024-01-15T10:30:45Z) -> detik sejak titik pertama.
+            # Titik tanpa time / gagal parse memakai index-nya.
+            timestamps = np.arange(len(lats), dtype=np.float64)
+            if len(lats):
+                parsed = pd.to_datetime(pd.Series(times, dtype=object), utc=True,
+                                        errors='coerce', format='ISO8601')
+                valid = parsed.notna().to_numpy()
+                if valid.any():
+                    seconds = (parsed - parsed[valid].iloc[0]).dt.total_seconds().to_numpy()
+                    timestamps[valid] = seconds[valid]
             
             self.mode = 'gpx'
-            if self.data:
-                self.start_lat = self.data[0].latitude
-                self.start_lon = self.data[0].longitude
+            self._set_arrays(timestamps, lats, lons, elevations)
+            if len(lats):
+                self.start_lat = float(lats[0])
+                self.start_lon = float(lons[0])
                 self.last_lat = self.start_lat
                 self.last_lon = self.start_lon
             
-            return len(self.data) > 0
+            return len(lats) > 0
             
         except Exception as e:
             print(f"Error loading GPX: {e}")
@@ -307,6 +449,52 @@ class GPSManager:
         self.total_frames = max(1, total_frames)
         self.last_lat = start_lat
         self.last_lon = start_lon
+        self._lat_track = None
+        self._lon_track = None
+    
+    def precompute_track(self, num_frames: int, fps: float = 30.0) -> bool:
+        """
+        Hitung lokasi untuk semua frame sekaligus (vectorized).
+        
+        Dipanggil sekali saat video dibuka; get_location_at_frame lalu
+        cukup membaca array. Tidak berlaku untuk mode realtime.
+        
+        Args:
+            num_frames: Jumlah frame yang di-precompute (index 0..num_frames-1)
+            fps: Frame per second video
+            
+        Returns:
+            True jika track berhasil di-precompute
+        """
+        self._lat_track = None
+        self._lon_track = None
+        
+        if self.mode == 'realtime' or num_frames <= 0 or fps <= 0:
+            return False
+        
+        frames = np.arange(num_frames, dtype=np.float64)
+        
+        if self.mode in ['csv', 'gpx'] and len(self._ts):
+            times = frames / fps
+            lat = np.interp(times, self._ts, self._lat)
+            lon = np.interp(times, self._ts, self._lon)
+        elif self.mode == 'manual':
+            t = np.minimum(1.0, frames / self.total_frames)
+            lat = self.start_lat + t * (self.end_lat - self.start_lat)
+            lon = self.start_lon + t * (self.end_lon - self.start_lon)
+        else:
+            lat, lon = self._get_simulated_location(frames)
+        
+        self._lat_track = lat
+        self._lon_track = lon
+        self._track_fps = fps
+        
+        # Jarak kumulatif dari titik awal, sekali hitung untuk semua frame
+        self._cum_dist_m = _cumulative_distance(
+            np.concatenate(([self._prev_lat], lat)),
+            np.concatenate(([self._prev_lon], lon))
+        )[1:] + self.total_distance_meters
+        return True
     
     def get_location_at_frame(self, frame_idx: int, fps: float = 30.0) -> Tuple[float, float]:
         """
@@ -321,6 +509,20 @@ class GPSManager:
         """
         lat, lon = 0.0, 0.0
         
+        track = self._lat_track
+        if (track is not None and 0 <= frame_idx < len(track)
+                and fps == self._track_fps):
+            # Sudah di-precompute (termasuk jarak kumulatif)
+            lat = float(track[frame_idx])
+            lon = float(self._lon_track[frame_idx])
+            self.total_distance_meters = float(self._cum_dist_m[frame_idx])
+            self._prev_lat = lat
+            self._prev_lon = lon
+            self._prev_cos_lat = None
+            self.last_lat = lat
+            self.last_lon = lon
+            return lat, lon
+        
         if self.mode == 'realtime':
             # ← PERBAIKAN: Gunakan realtime GPS yang benar
             lat, lon = self.get_realtime_location()
@@ -328,7 +530,7 @@ class GPSManager:
         elif self.mode == 'simulation':
             lat, lon = self._get_simulated_location(frame_idx)
             
-        elif self.mode in ['csv', 'gpx'] and self.data:
+        elif self.mode in ['csv', 'gpx'] and len(self._ts):
             lat, lon = self._get_interpolated_location(frame_idx, fps)
             
         elif self.mode == 'manual':
@@ -338,11 +540,7 @@ class GPSManager:
             lat, lon = self._get_simulated_location(frame_idx)
         
         # Update tracking
-        self.total_distance_meters += self.haversine_distance(
-            self._prev_lat, self._prev_lon, lat, lon
-        )
-        self._prev_lat = lat
-        self._prev_lon = lon
+        self.total_distance_meters += self._distance_from_prev(lat, lon)
         self.last_lat = lat
         self.last_lon = lon
         
@@ -358,41 +556,25 @@ class GPSManager:
         
         return lat, lon
     
+    def _set_arrays(self, ts: np.ndarray, lat: np.ndarray, lon: np.ndarray,
+                    ele: Optional[np.ndarray] = None):
+        """Simpan array timestamp/lat/lon/elevation, diurutkan per timestamp"""
+        order = np.argsort(ts, kind='stable')
+        self._ts = ts[order]
+        self._lat = lat[order]
+        self._lon = lon[order]
+        self._ele = ele[order] if ele is not None else np.zeros(len(ts), dtype=np.float64)
+        self._points = None
+        self._lat_track = None
+        self._lon_track = None
+    
     def _get_interpolated_location(self, frame_idx: int, fps: float) -> Tuple[float, float]:
-        """Interpolasi lokasi dari data GPS yang sudah di-load"""
-        if not self.data:
+        """Interpolasi lokasi dari data GPS yang sudah di-load (binary search)"""
+        if len(self._ts) == 0:
             return self.start_lat, self.start_lon
         
         # Konversi frame ke detik
-        current_time = frame_idx / fps
-        
-        # Cari 2 titik terdekat untuk interpolasi
-        prev_point = self.data[0]
-        next_point = self.data[-1]
-        
-        for i, point in enumerate(self.data):
-            if point.timestamp >= current_time:
-                next_point = point
-                if i > 0:
-                    prev_point = self.data[i-1]
-                break
-            prev_point = point
-        
-        # Jika sudah melewati data terakhir
-        if current_time >= self.data[-1].timestamp:
-            return self.data[-1].latitude, self.data[-1].longitude
-        
-        # Interpolasi linear
-        if prev_point.timestamp == next_point.timestamp:
-            return prev_point.latitude, prev_point.longitude
-        
-        t = (current_time - prev_point.timestamp) / (next_point.timestamp - prev_point.timestamp)
-        t = max(0.0, min(1.0, t))  # Clamp ke [0, 1]
-        
-        lat = prev_point.latitude + t * (next_point.latitude - prev_point.latitude)
-        lon = prev_point.longitude + t * (next_point.longitude - prev_point.longitude)
-        
-        return lat, lon
+        return _interp_scalar(frame_idx / fps, self._ts, self._lat, self._lon)
     
     def _get_manual_location(self, frame_idx: int) -> Tuple[float, float]:
         """Interpolasi linear dari start ke end"""
@@ -406,20 +588,34 @@ class GPSManager:
         
         return lat, lon
     
-    def haversine_distance(self, lat1: float, lon1: float, 
-                          lat2: float, lon2: float) -> float:
+    @staticmethod
+    def haversine_distance(lat1: float, lon1: float, 
+                           lat2: float, lon2: float) -> float:
         """Hitung jarak Haversine (dalam meter) antara dua titik"""
-        R = 6371000  # Jari-jari bumi (meter)
+        return _haversine_scalar(lat1, lon1, lat2, lon2)
+    
+    def _distance_from_prev(self, lat: float, lon: float) -> float:
+        """
+        Haversine dari titik sebelumnya ke (lat, lon), lalu geser titik sebelumnya.
         
-        lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+        cos(lat) titik sebelumnya di-cache dari panggilan terakhir, jadi
+        tiap update cukup satu cos.
+        """
+        cos_prev = self._prev_cos_lat
+        if cos_prev is None:
+            cos_prev = _cos(_rad(self._prev_lat))
         
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
+        lat_r = _rad(lat)
+        cos_lat = _cos(lat_r)
+        dlat = lat_r - _rad(self._prev_lat)
+        dlon = _rad(lon - self._prev_lon)
         
-        a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-        c = 2 * asin(sqrt(a))
+        a = _sin(dlat * 0.5) ** 2 + cos_prev * cos_lat * _sin(dlon * 0.5) ** 2
         
-        return R * c
+        self._prev_lat = lat
+        self._prev_lon = lon
+        self._prev_cos_lat = cos_lat
+        return 2 * EARTH_RADIUS_M * _asin(_sqrt(a))
     
     def get_total_distance_km(self) -> float:
         """Dapatkan total jarak yang sudah ditempuh dalam km"""
@@ -432,6 +628,7 @@ class GPSManager:
         self.total_distance_meters = 0.0
         self._prev_lat = self.start_lat
         self._prev_lon = self.start_lon
+        self._prev_cos_lat = None
     
     def get_route_bounds(self) -> Tuple[float, float, float, float]:
         """
@@ -440,10 +637,9 @@ class GPSManager:
         Returns:
             (min_lat, max_lat, min_lon, max_lon)
         """
-        if self.data:
-            lats = [p.latitude for p in self.data]
-            lons = [p.longitude for p in self.data]
-            return min(lats), max(lats), min(lons), max(lons)
+        if len(self._lat):
+            return (float(self._lat.min()), float(self._lat.max()),
+                    float(self._lon.min()), float(self._lon.max()))
         else:
             return (self.start_lat, self.end_lat, self.start_lon, self.end_lon)
 
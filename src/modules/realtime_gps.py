@@ -6,6 +6,7 @@ Menggunakan streamlit-js-eval untuk bridge JavaScript GPS ke Python.
 import streamlit as st
 from typing import Tuple, Optional, Dict, Any
 from dataclasses import dataclass
+from functools import lru_cache
 import time
 
 # Try import streamlit-js-eval
@@ -42,6 +43,7 @@ class RealtimeGPS:
         self._last_data: Optional[GPSData] = None
         self._last_update: float = 0
         self._cache_duration: float = 1.0  # Cache selama 1 detik
+        self._last_stamp: Optional[float] = None  # Timestamp fix terakhir dari browser
         self._fallback_lat: float = -6.9024
         self._fallback_lon: float = 107.6188
         
@@ -80,6 +82,13 @@ class RealtimeGPS:
             location = get_geolocation()
             
             if location and 'coords' in location:
+                # Browser mengirim ulang fix yang sama (timestamp tidak berubah):
+                # pakai data lama, tanpa rebuild GPSData / tulis session_state
+                stamp = location.get('timestamp')
+                if self._last_data and stamp is not None and stamp == self._last_stamp:
+                    self._last_update = current_time
+                    return self._last_data.latitude, self._last_data.longitude, self._last_data.accuracy
+                
                 coords = location['coords']
                 
                 self._last_data = GPSData(
@@ -92,6 +101,7 @@ class RealtimeGPS:
                     timestamp=location.get('timestamp', current_time * 1000)
                 )
                 self._last_update = current_time
+                self._last_stamp = stamp
                 
                 # Update session state
                 st.session_state['realtime_gps_data'] = {
@@ -243,12 +253,9 @@ def get_realtime_gps() -> RealtimeGPS:
 # HTML Component for GPS Display
 # ============================================
 
-def create_gps_component_html(key: str = "gps") -> str:
-    """
-    Create HTML component for GPS display.
-    This renders a visual GPS status widget.
-    """
-    return f"""
+# Template HTML widget GPS; placeholder: {key}, {update_distance},
+# {min_interval_ms} (kurung kurawal CSS/JS di-escape jadi {{ }})
+_GPS_COMPONENT_TEMPLATE = """
     <style>
         .gps-container {{
             font-family: 'Segoe UI', sans-serif;
@@ -332,16 +339,63 @@ def create_gps_component_html(key: str = "gps") -> str:
             return;
         }}
         
+        const minDist2 = {update_distance} * {update_distance};
+        const minInterval = {min_interval_ms};
+        let lastTs = null;
+        let lastEmit = null;
+        let watchId = null;
+        
+        // Tulis DOM sekali per animation frame; nilai terbaru yang menang
+        let pending = null;
+        
+        function flush() {{
+            const v = pending;
+            pending = null;
+            indicator.className = v.cls;
+            statusText.textContent = v.status;
+            if (v.lat !== undefined) {{
+                latEl.textContent = v.lat;
+                lonEl.textContent = v.lon;
+            }}
+        }}
+        
+        function render(v) {{
+            const queued = pending !== null;
+            pending = v;
+            if (!queued) requestAnimationFrame(flush);
+        }}
+        
         function updatePosition(pos) {{
-            indicator.className = 'gps-status gps-active';
-            statusText.textContent = 'GPS Active';
-            latEl.textContent = pos.coords.latitude.toFixed(6);
-            lonEl.textContent = pos.coords.longitude.toFixed(6);
+            // Fix yang sama dikirim ulang (getCurrentPosition + watch, maximumAge)
+            if (pos.timestamp === lastTs) return;
+            lastTs = pos.timestamp;
+            
+            // Filter jitter: update hanya jika pindah >= updateDistance meter
+            // atau sudah >= minInterval ms sejak update terakhir
+            const lat = pos.coords.latitude;
+            const lon = pos.coords.longitude;
+            const now = Date.now();
+            if (lastEmit !== null && now - lastEmit.t < minInterval) {{
+                // Equirectangular, cukup akurat untuk jarak beberapa meter
+                const dx = (lon - lastEmit.lon) * Math.cos(lat * Math.PI / 180) * 111320;
+                const dy = (lat - lastEmit.lat) * 110540;
+                if (dx * dx + dy * dy < minDist2) return;
+            }}
+            lastEmit = {{lat: lat, lon: lon, t: now}};
+            
+            render({{
+                cls: 'gps-status gps-active',
+                status: 'GPS Active',
+                lat: lat.toFixed(6),
+                lon: lon.toFixed(6)
+            }});
         }}
         
         function handleError(err) {{
-            indicator.className = 'gps-status gps-error';
-            statusText.textContent = 'GPS Error: ' + err.message;
+            render({{
+                cls: 'gps-status gps-error',
+                status: 'GPS Error: ' + err.message
+            }});
         }}
         
         // Initial request
@@ -350,16 +404,50 @@ def create_gps_component_html(key: str = "gps") -> str:
             timeout: 10000
         }});
         
-        // Watch for updates
-        navigator.geolocation.watchPosition(updatePosition, handleError, {{
-            enableHighAccuracy: true,
-            maximumAge: 5000
+        // Watch for updates (dihentikan selama tab tersembunyi)
+        function startWatch() {{
+            if (watchId !== null) return;
+            watchId = navigator.geolocation.watchPosition(updatePosition, handleError, {{
+                enableHighAccuracy: true,
+                maximumAge: 5000
+            }});
+        }}
+        
+        function stopWatch() {{
+            if (watchId === null) return;
+            navigator.geolocation.clearWatch(watchId);
+            watchId = null;
+        }}
+        
+        document.addEventListener('visibilitychange', () => {{
+            if (document.hidden) stopWatch(); else startWatch();
         }});
+        
+        if (!document.hidden) startWatch();
     }})();
     </script>
     """
 
 
+@lru_cache(maxsize=8)
+def create_gps_component_html(key: str = "gps", update_distance: float = 5.0,
+                              min_interval: float = 3.0) -> str:
+    """
+    Create HTML component for GPS display.
+    This renders a visual GPS status widget.
+    
+    Args:
+        key: ID unik widget
+        update_distance: Jarak minimum (meter) agar fix baru ditampilkan
+        min_interval: Detik maksimum tanpa update walau posisi diam
+    """
+    return _GPS_COMPONENT_TEMPLATE.format(
+        key=key,
+        update_distance=float(update_distance),
+        min_interval_ms=int(min_interval * 1000)
+    )
+
+
 def render_realtime_gps(placeholder=None):
     """
     Render realtime GPS and return current location.